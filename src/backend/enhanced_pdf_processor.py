@@ -1,93 +1,150 @@
 import fitz
+import numpy as np
 from document_processor import DocumentProcessor, DocumentChunk
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple, Iterator
 import logging
 import os
+import stat
+import sys
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+# Spans larger than this (in points) or set in bold are treated as section headers
+HEADER_FONT_SIZE = 14
+BOLD_FLAG = 2**4
+
+# "dict" extraction without image blocks: images are never used, and by default
+# MuPDF decodes and copies every image on the page into the result
+SPAN_TEXT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+# Shared by every chunk's metadata
+_DOC_TYPE_PDF = sys.intern("pdf")
+
+def _base_metadata(pdf_path: str, total_pages: int) -> Dict:
+    """Metadata shared by every page of a document"""
+    return {
+        "file_path": pdf_path,
+        "document_type": _DOC_TYPE_PDF,
+        "total_pages": total_pages
+    }
+
+def _chunk_page(page_text: str, page_num: int, base_metadata: Dict, doc_processor: DocumentProcessor) -> List[DocumentChunk]:
+    """Chunk the text of a single page"""
+    # Create metadata for this page; key order feeds the chunk ID, so page_number stays first
+    metadata = {"page_number": page_num + 1, **base_metadata}
+    
+    # Process page text into chunks
+    return doc_processor.create_chunks(page_text, metadata)
+
+def _chunk_pages(doc, pdf_path: str, page_count: int, doc_processor: DocumentProcessor) -> Iterator[List[DocumentChunk]]:
+    """Yield the chunks of each of the first page_count pages of an open document"""
+    base_metadata = _base_metadata(pdf_path, doc.page_count)
+    for page_num in range(page_count):
+        try:
+            page = doc.load_page(page_num)
+            
+            # Plain text straight from MuPDF; span fonts are only needed by extract_sections
+            page_text = page.get_text("text")
+            
+            page_chunks = _chunk_page(page_text, page_num, base_metadata, doc_processor)
+            
+        except Exception as e:
+            logger.warning(f"Error extracting text from page {page_num}: {e}")
+            page_chunks = []
+        yield page_chunks
+
+def _flatten_spans(page) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """Span texts of a page with their font sizes and flags as parallel arrays"""
+    texts = []
+    sizes = []
+    flags = []
+    for block in page.get_text("dict", flags=SPAN_TEXT_FLAGS)["blocks"]:
+        for line in block.get("lines", ()):
+            for span in line["spans"]:
+                texts.append(span["text"])
+                sizes.append(span.get("size", 12))
+                flags.append(span.get("flags", 0))
+    return texts, np.asarray(sizes, dtype=np.float32), np.asarray(flags, dtype=np.uint32)
+
+def _page_spans(doc, page_count: int) -> List[Optional[Tuple[List[str], np.ndarray, np.ndarray]]]:
+    """Flattened spans of the first page_count pages of an open document; None for unreadable pages"""
+    pages = []
+    for page_num in range(page_count):
+        try:
+            pages.append(_flatten_spans(doc.load_page(page_num)))
+        except Exception as e:
+            logger.warning(f"Error extracting text from page {page_num}: {e}")
+            pages.append(None)
+    return pages
+
 class EnhancedPDFProcessor:
     def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
         self.doc_processor = DocumentProcessor(chunk_size, chunk_overlap)
         
     def validate_pdf_path(self, pdf_path: str) -> str:
         """Validate PDF file path and existence"""
+        self._stat_pdf(pdf_path)
+        return pdf_path
+    
+    def _stat_pdf(self, pdf_path: str) -> os.stat_result:
+        """Validate a PDF path, returning its stat"""
         if not isinstance(pdf_path, str):
             raise ValueError("PDF path must be a string")
         
-        if not os.path.exists(pdf_path):
+        # One stat call answers both existence and size
+        try:
+            st = os.stat(pdf_path)
+        except OSError:
             raise ValueError("PDF file does not exist")
         
+        if not stat.S_ISREG(st.st_mode):
+            raise ValueError("PDF path is not a file")
+        
         if not pdf_path.lower().endswith('.pdf'):
             raise ValueError("File must be a PDF")
         
         # Check file size (limit to 50MB for PDFs)
-        file_size = os.path.getsize(pdf_path)
-        if file_size > 50 * 1024 * 1024:  # 50MB
+        if st.st_size > 50 * 1024 * 1024:  # 50MB
             raise ValueError("PDF file too large. Maximum size is 50MB")
         
-        return pdf_path
-        
+        return st
+    
     def extract_with_structure(self, pdf_path: str) -> List[DocumentChunk]:
         """Extract PDF with preserved structure and intelligent chunking"""
+        chunks = list(self.iter_chunks(pdf_path))
+        logger.info(f"Successfully processed PDF: {len(chunks)} chunks created")
+        return chunks
+    
+    def iter_chunks(self, pdf_path: str) -> Iterator[DocumentChunk]:
+        """Yield the chunks of extract_with_structure page by page instead of building the whole list"""
         try:
             # Validate the PDF path
-            pdf_path = self.validate_pdf_path(pdf_path)
+            self._stat_pdf(pdf_path)
             
             # Open the PDF document
             doc = fitz.open(pdf_path)
-            
-            if doc.page_count == 0:
-                logger.warning("PDF has no pages")
+            try:
+                if doc.needs_pass:
+                    logger.error("PDF is password protected")
+                    raise ValueError("PDF is password protected")
+                
+                if doc.page_count == 0:
+                    logger.warning("PDF has no pages")
+                    return
+                
+                max_pages = 100  # Limit to prevent memory issues
+                page_count = min(doc.page_count, max_pages)
+                
+                # Extract text from each page with structure preservation
+                for page_chunks in _chunk_pages(doc, pdf_path, page_count, self.doc_processor):
+                    yield from page_chunks
+            finally:
                 doc.close()
-                return []
-            
-            all_chunks = []
-            max_pages = 100  # Limit to prevent memory issues
-            
-            # Extract text from each page with structure preservation
-            for page_num in range(min(doc.page_count, max_pages)):
-                try:
-                    page = doc.load_page(page_num)
-                    
-                    # Extract text with layout preservation
-                    text_blocks = page.get_text("dict")["blocks"]
-                    
-                    page_text = ""
-                    for block in text_blocks:
-                        if "lines" in block:
-                            for line in block["lines"]:
-                                for span in line["spans"]:
-                                    page_text += span["text"] + " "
-                    
-                    # Create metadata for this page
-                    metadata = {
-                        "page_number": page_num + 1,
-                        "file_path": pdf_path,
-                        "document_type": "pdf",
-                        "total_pages": doc.page_count
-                    }
-                    
-                    # Process page text into chunks
-                    page_chunks = self.doc_processor.create_chunks(page_text, metadata)
-                    all_chunks.extend(page_chunks)
-                    
-                except Exception as e:
-                    logger.warning(f"Error extracting text from page {page_num}: {e}")
-                    continue
-            
-            doc.close()
-            
-            logger.info(f"Successfully processed PDF: {len(all_chunks)} chunks created")
-            return all_chunks
             
         except fitz.FileDataError as e:
             logger.error(f"PDF file is corrupted or invalid: {e}")
             raise ValueError("PDF file is corrupted or invalid")
-        except fitz.PasswordError as e:
-            logger.error(f"PDF is password protected: {e}")
-            raise ValueError("PDF is password protected")
         except Exception as e:
             logger.error(f"Error extracting text from PDF: {e}")
             raise ValueError(f"Failed to extract text from PDF: {str(e)}")
@@ -96,77 +153,64 @@ class EnhancedPDFProcessor:
         """Extract PDF with section-based chunking (identifies headers and sections)"""
         try:
             # Validate the PDF path
-            pdf_path = self.validate_pdf_path(pdf_path)
+            self._stat_pdf(pdf_path)
             
-            # Open the PDF document
+            # Open the PDF document and read every page's spans up front
             doc = fitz.open(pdf_path)
-            
-            if doc.page_count == 0:
-                logger.warning("PDF has no pages")
+            try:
+                if doc.page_count == 0:
+                    logger.warning("PDF has no pages")
+                    return {}
+                
+                max_pages = 100  # Limit to prevent memory issues
+                page_spans = _page_spans(doc, min(doc.page_count, max_pages))
+            finally:
                 doc.close()
-                return {}
             
+            base_metadata = {"file_path": pdf_path, "document_type": _DOC_TYPE_PDF}
             sections = {}
             current_section = "main"
-            current_text = ""
-            
-            max_pages = 100  # Limit to prevent memory issues
+            current_parts = []
+            # Spans of the header run being read; a multi-span header names one section
+            header_parts = []
+            in_header = False
             
-            for page_num in range(min(doc.page_count, max_pages)):
+            for page_num, spans in enumerate(page_spans):
+                if spans is None:
+                    continue
                 try:
-                    page = doc.load_page(page_num)
+                    texts, sizes, flags = spans
+                    
+                    # Simple header detection (larger font or bold), for the whole page at once
+                    is_header = (sizes > HEADER_FONT_SIZE) | ((flags & BOLD_FLAG) != 0)
                     
-                    # Extract text with layout preservation
-                    text_blocks = page.get_text("dict")["blocks"]
+                    # Positions where spans switch between header and body text, carrying
+                    # the state over from the previous page
+                    edges = np.flatnonzero(np.diff(is_header.astype(np.int8), prepend=np.int8(in_header)))
                     
-                    for block in text_blocks:
-                        if "lines" in block:
-                            for line in block["lines"]:
-                                for span in line["spans"]:
-                                    text = span["text"]
-                                    
-                                    # Check if this might be a header (larger font, bold, etc.)
-                                    font_size = span.get("size", 12)
-                                    is_bold = span.get("flags", 0) & 2**4  # Bold flag
-                                    
-                                    # Simple header detection
-                                    if font_size > 14 or is_bold:
-                                        # This might be a header, start new section
-                                        if current_text.strip():
-                                            # Process current section
-                                            metadata = {
-                                                "page_number": page_num + 1,
-                                                "file_path": pdf_path,
-                                                "document_type": "pdf",
-                                                "section": current_section
-                                            }
-                                            chunks = self.doc_processor.create_chunks(current_text, metadata)
-                                            if chunks:
-                                                sections[current_section] = chunks
-                                        
-                                        # Start new section
-                                        current_section = text.strip()[:50]  # Use first 50 chars as section name
-                                        current_text = text + " "
-                                    else:
-                                        current_text += text + " "
+                    start = 0
+                    for i in edges.tolist():
+                        if not in_header:
+                            # A header starts, so the current section ends here
+                            current_parts.extend(texts[start:i])
+                            self._add_section(sections, current_section, current_parts, page_num, base_metadata)
+                            header_parts = []
+                        else:
+                            # The header ends; start new section
+                            header_parts.extend(texts[start:i])
+                            current_section, current_parts = self._start_section(header_parts)
+                        in_header = not in_header
+                        start = i
+                    (header_parts if in_header else current_parts).extend(texts[start:])
                     
                 except Exception as e:
                     logger.warning(f"Error extracting text from page {page_num}: {e}")
                     continue
             
             # Process final section
-            if current_text.strip():
-                metadata = {
-                    "page_number": page_num + 1,
-                    "file_path": pdf_path,
-                    "document_type": "pdf",
-                    "section": current_section
-                }
-                chunks = self.doc_processor.create_chunks(current_text, metadata)
-                if chunks:
-                    sections[current_section] = chunks
-            
-            doc.close()
+            if in_header:
+                current_section, current_parts = self._start_section(header_parts)
+            self._add_section(sections, current_section, current_parts, page_num, base_metadata)
             
             logger.info(f"Successfully processed PDF with sections: {len(sections)} sections found")
             return sections
@@ -175,6 +219,20 @@ class EnhancedPDFProcessor:
             logger.error(f"Error extracting sections from PDF: {e}")
             raise ValueError(f"Failed to extract sections from PDF: {str(e)}")
     
+    def _start_section(self, header_parts: List[str]) -> Tuple[str, List[str]]:
+        """Name and initial text of the section introduced by a header run"""
+        header = " ".join(header_parts)
+        return sys.intern(header.strip()[:50]), [header]  # Use first 50 chars as section name
+    
+    def _add_section(self, sections: Dict[str, List[DocumentChunk]], section: str, parts: List[str], page_num: int, base_metadata: Dict):
+        """Chunk a finished section's text into sections, skipping blank sections"""
+        current_text = " ".join(parts)
+        if current_text.strip():
+            metadata = {"page_number": page_num + 1, **base_metadata, "section": section}
+            chunks = self.doc_processor.create_chunks(current_text, metadata)
+            if chunks:
+                sections[section] = chunks
+    
     def get_processing_statistics(self, chunks: List[DocumentChunk]) -> Dict:
         """Get statistics about the PDF processing"""
         if not chunks:
@@ -1,62 +1,384 @@
 import os
+import re
 import json
+import math
+import functools
+import itertools
+import hashlib
+import importlib.util
 import platform
+import random
 import subprocess
 import shutil
+import string
 import logging
 import time
+import threading
+import queue
+import atexit
 import tempfile
+from concurrent.futures import Future, TimeoutError as FuturesTimeoutError
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 from datetime import datetime
 import sys
 
-# Fine-tuning imports
-FINE_TUNING_AVAILABLE = False
+import gpu_probe
+
+try:
+    import ijson  # Optional: incremental parsing of large JSON training files
+except ImportError:
+    ijson = None
+
+try:
+    import numpy as np  # Optional: vectorised chunk boundary search
+except ImportError:
+    np = None
+
+try:
+    import orjson  # Optional: faster serialisation of progress updates
+except ImportError:
+    orjson = None
+
+try:
+    import ollama  # Optional: talk to the Ollama daemon over HTTP rather than the CLI
+except ImportError:
+    ollama = None
+
 try:
-    import torch
-    import transformers
-    from transformers import (
-        AutoTokenizer, 
-        AutoModelForCausalLM, 
-        TrainingArguments, 
-        Trainer,
-        DataCollatorForLanguageModeling,
-        TrainerCallback
-    )
-    from peft import (
-        LoraConfig, 
-        get_peft_model, 
-        TaskType,
-        prepare_model_for_kbit_training
-    )
-    from datasets import Dataset
-    from trl import SFTTrainer
-    import accelerate
-    import bitsandbytes as bnb
-    FINE_TUNING_AVAILABLE = True
-except ImportError as e:
-    logging.warning(f"Fine-tuning dependencies not available: {e}")
-    FINE_TUNING_AVAILABLE = False
+    import psutil  # Optional: available-memory check before loading a model on CPU
+except ImportError:
+    psutil = None
+
+try:
+    # Optional: columnar CSV parsing (installed alongside datasets)
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = None
+
+# When hf_xet is installed, xet-backed repos are fetched chunk-wise; let it use all
+# available cores and bandwidth for the multi-GB weight download. huggingface_hub
+# reads this once at import time, so it must be set before transformers is imported.
+os.environ.setdefault("HF_XET_HIGH_PERFORMANCE", "1")
+# Likewise route regular (non-xet) downloads through the Rust parallel downloader,
+# but only when it's installed; huggingface_hub refuses to download otherwise
+if importlib.util.find_spec("hf_transfer") is not None:
+    os.environ.setdefault("HF_HUB_ENABLE_HF_TRANSFER", "1")
+
+# Fine-tuning imports. torch, transformers and friends take seconds and a lot of
+# RAM to import, and most processes that load this module (model export, listing)
+# never train, so they are only imported once start_fine_tuning is called.
+@functools.lru_cache(maxsize=None)
+def _check_ft_deps() -> bool:
+    """Import the fine-tuning dependencies into module scope, once"""
+    global torch, transformers, AutoTokenizer, AutoModelForCausalLM, TrainingArguments
+    global Trainer, DataCollatorForLanguageModeling, TrainerCallback
+    global LoraConfig, get_peft_model, TaskType, prepare_model_for_kbit_training
+    global Dataset, SFTTrainer, accelerate, bnb
+    try:
+        import torch
+        import transformers
+        from transformers import (
+            AutoTokenizer, 
+            AutoModelForCausalLM, 
+            TrainingArguments, 
+            Trainer,
+            DataCollatorForLanguageModeling,
+            TrainerCallback
+        )
+        from peft import (
+            LoraConfig, 
+            get_peft_model, 
+            TaskType,
+            prepare_model_for_kbit_training
+        )
+        from datasets import Dataset
+        from trl import SFTTrainer
+        import accelerate
+        import bitsandbytes as bnb
+        return True
+    except ImportError as e:
+        logging.warning(f"Fine-tuning dependencies not available: {e}")
+        return False
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Training data validation limits
+VALID_TRAINING_EXTENSIONS = frozenset({'.txt', '.md', '.json', '.csv', '.docx', '.pdf'})
+MAX_TRAINING_DATA_BYTES = 100 * 1024 * 1024  # 100MB
+READ_BUFFER_SIZE = 1 << 20  # 1MB blocks when streaming training files from disk
+
+# Worker processes used by datasets.map when tokenizing the training set
+TOKENIZE_NUM_PROC = max(1, (os.cpu_count() or 2) // 2)
+# Non-reentrant checkpointing works with frozen base weights (LoRA) and is what
+# torch recommends; the reentrant default warns and can drop gradients
+GRADIENT_CHECKPOINTING_KWARGS = {"use_reentrant": False}
+# DataLoader workers for collating batches. Workers are spawned (not forked) on
+# Windows and macOS, where re-importing torch per worker costs more than it saves
+DATALOADER_NUM_WORKERS = 0 if platform.system() in ("Windows", "Darwin") else min(4, max(1, (os.cpu_count() or 2) // 2))
+# Batches accumulated per optimizer step
+GRADIENT_ACCUMULATION_STEPS = 4
+# Token length every training example is truncated to
+MAX_SEQ_LENGTH = 512
+TOKENIZE_KWARGS = {"truncation": True, "max_length": MAX_SEQ_LENGTH}
+# Tokenized datasets kept in fine_tuned_models/cache (most recently used first)
+TOKENIZED_CACHE_MAX_ENTRIES = 5
+
+# Attention projection names across the supported architectures (Llama/Mistral,
+# fused Phi-3, Falcon/GPT-NeoX, GPT-2). LoRA is attached to whichever the loaded
+# model actually has; a config naming none of them would train nothing.
+LORA_TARGET_KEYWORDS = ("q_proj", "k_proj", "v_proj", "o_proj", "qkv_proj", "query_key_value", "c_attn")
+DEFAULT_LORA_TARGET_MODULES = ["q_proj", "v_proj", "k_proj", "o_proj"]
+
+# Hugging Face models whose architectures ship with transformers itself. Loading
+# them without trust_remote_code skips the remote-code probe against the Hub.
+NATIVE_HF_MODEL_PREFIXES = (
+    "meta-llama/",
+    "mistralai/",
+    "codellama/",
+    "google/gemma",
+    "Qwen/Qwen2",
+    "microsoft/Phi-3-mini",
+    "microsoft/Phi-3-medium",
+)
+
+# The bitsandbytes check imports torch, so it runs in its own process, see gpu_probe.py
+GPU_PROBE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gpu_probe.py')
+
+# Files whose presence in the local Hugging Face cache means we can skip the Hub
+HF_TOKENIZER_FILES = ("tokenizer_config.json",)
+HF_SAFETENSORS_WEIGHT_FILES = (
+    "model.safetensors",
+    "model.safetensors.index.json",
+)
+HF_WEIGHT_FILES = HF_SAFETENSORS_WEIGHT_FILES + (
+    "pytorch_model.bin",
+    "pytorch_model.bin.index.json",
+)
+# LoRA adapter weights written by save_model: safetensors with current peft/transformers,
+# .bin for models trained with older versions
+ADAPTER_WEIGHT_FILES = ("adapter_model.safetensors", "adapter_model.bin")
+
+# Ollama model name -> Hugging Face checkpoint. Families are matched lowercased with
+# '-' and '_' removed and are listed in matching priority order
+_MODEL_FAMILY_PRIORITY = ('llama3', 'llama2', 'phi', 'mistral', 'codellama', 'code', 'gemma', 'qwen')
+_MODEL_FAMILY_RE = re.compile(r'(?=(%s))' % '|'.join(_MODEL_FAMILY_PRIORITY))
+_MODEL_FAMILY_ALIASES = {'code': 'codellama'}
+# Sizes are matched on the unstripped name and must follow a separator, so the
+# family's own version digit isn't read as part of the size ("llama2-13b" is 13b)
+_MODEL_SIZE_RE = re.compile(r'(?:^|[:\-_.])(\d+b)\b')
+_MODEL_VARIANT_RE = re.compile(r'mini|small|medium')
+# Keyed by (family, size/variant); a None variant is the family default
+_HF_TABLE = {
+    ('llama3', '3b'): "meta-llama/Llama-3.2-3B-Instruct",
+    ('llama3', '8b'): "meta-llama/Llama-3.2-8B-Instruct",
+    ('llama3', '70b'): "meta-llama/Llama-3.2-70B-Instruct",
+    ('llama3', None): "meta-llama/Llama-3.2-3B-Instruct",
+    ('llama2', '7b'): "meta-llama/Llama-2-7b-chat-hf",
+    ('llama2', '13b'): "meta-llama/Llama-2-13b-chat-hf",
+    ('llama2', '70b'): "meta-llama/Llama-2-70b-chat-hf",
+    ('llama2', None): "meta-llama/Llama-2-7b-chat-hf",
+    ('phi', 'mini'): "microsoft/Phi-3-mini-4k-instruct",
+    ('phi', 'small'): "microsoft/Phi-3-small-8k-instruct",
+    ('phi', 'medium'): "microsoft/Phi-3-medium-4k-instruct",
+    ('phi', None): "microsoft/Phi-3-mini-4k-instruct",
+    ('mistral', None): "mistralai/Mistral-7B-Instruct-v0.2",
+    ('codellama', '7b'): "codellama/CodeLlama-7b-Instruct-hf",
+    ('codellama', '13b'): "codellama/CodeLlama-13b-Instruct-hf",
+    ('codellama', '34b'): "codellama/CodeLlama-34b-Instruct-hf",
+    ('codellama', None): "codellama/CodeLlama-7b-Instruct-hf",
+    ('gemma', '2b'): "google/gemma-2b-it",
+    ('gemma', '7b'): "google/gemma-7b-it",
+    ('gemma', None): "google/gemma-2b-it",
+    ('qwen', '7b'): "Qwen/Qwen2-7B-Instruct",
+    ('qwen', '14b'): "Qwen/Qwen2-14B-Instruct",
+    ('qwen', '72b'): "Qwen/Qwen2-72B-Instruct",
+    ('qwen', None): "Qwen/Qwen2-7B-Instruct",
+}
+
+# Minimum seconds between per-step training progress updates (~4 per second)
+PROGRESS_UPDATE_INTERVAL = 0.25
+
+# Seconds a check_system_requirements result is reused (free disk space can change)
+SYSTEM_REQUIREMENTS_TTL = 60
+
+# Instruction-format wrapper around every training example, built once
+INSTRUCTION_PREFIX = "### Instruction:\n"
+TEXT_RESPONSE_SUFFIX = "\n\n### Response:\nThe model will learn to respond appropriately to this type of content."
+DATA_RESPONSE_SUFFIX = "\n\n### Response:\nThe model will learn to respond appropriately to this data."
+DEFAULT_RESPONSE_SUFFIX = "\n\n### Response:\nThe model will learn to respond appropriately."
+
+# Ollama Modelfile written by export_to_ollama. A string.Template rather than an
+# f-string so the Go template braces in TEMPLATE need no escaping
+MODELFILE_TEMPLATE = string.Template('''# Fine-tuned model: $name
+# Base model: $base_model
+# Created with ACE UI for Ollama
+
+FROM $base_model
+
+# Load the fine-tuned adapter
+ADAPTER $name
+
+# System prompt template
+SYSTEM "You are a helpful AI assistant that has been fine-tuned for specific tasks."
+
+# Chat template
+TEMPLATE """{{ if .System }}{{ .System }}{{ end }}
+
+{{ .Prompt }}"""
+
+# Parameters for better performance
+PARAMETER temperature 0.7
+PARAMETER top_p 0.9
+PARAMETER top_k 40
+PARAMETER num_ctx 4096
+PARAMETER repeat_penalty 1.1
+PARAMETER stop "### Instruction:"
+PARAMETER stop "### Response:"
+''')
+
+# Upper bound (seconds) on the backoff between Hugging Face download attempts
+MAX_RETRY_DELAY = 60
+# Timeout (seconds) for the Hub file-size lookup in the pre-flight resource check
+HF_METADATA_TIMEOUT = 10
+
+class InsufficientResourcesError(Exception):
+    """Raised before a model download when the machine can't hold the model"""
+
+def _json_bytes(data) -> bytes:
+    """Serialise data as indented UTF-8 JSON for files written in one call"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, indent=2).encode('utf-8')
+
+def _progress_line(progress_data: Dict) -> str:
+    """Serialise a progress update into the line format parsed by main.js"""
+    if orjson is not None:
+        serialised = orjson.dumps(progress_data).decode('utf-8')
+        # orjson can't escape to ASCII; keep non-ASCII messages safe for
+        # stdout encodings like cp1252 by letting json escape them
+        if serialised.isascii():
+            return f"PROGRESS_UPDATE: {serialised}\n"
+    return f"PROGRESS_UPDATE: {json.dumps(progress_data, separators=(',', ':'))}\n"
+
+# Progress lines are written by a background thread so training and download
+# threads never wait on the stdout pipe to main.js
+_progress_queue = queue.Queue(maxsize=64)
+_progress_writer_lock = threading.Lock()
+_progress_writer_thread = None
+
+def _progress_writer() -> None:
+    """Drain queued progress updates to stdout, one whole line per write"""
+    while True:
+        item = _progress_queue.get()
+        try:
+            sys.stdout.write(item if isinstance(item, str) else _progress_line(item))
+            sys.stdout.flush()
+        except Exception:
+            pass  # A closed pipe must not stop the writer, or flushing would hang
+        finally:
+            _progress_queue.task_done()
+
+def _write_progress_line(progress, block: bool = True) -> None:
+    """Queue a progress update (a serialised line or a dict) for the background writer
+    
+    With block=False the update is dropped when the writer is behind; use it for
+    frequent updates that the next one supersedes.
+    """
+    global _progress_writer_thread
+    if _progress_writer_thread is None:
+        with _progress_writer_lock:
+            if _progress_writer_thread is None:
+                _progress_writer_thread = threading.Thread(target=_progress_writer, daemon=True)
+                _progress_writer_thread.start()
+    try:
+        _progress_queue.put(progress, block=block)
+    except queue.Full:
+        pass
+
+def _flush_progress() -> None:
+    """Block until every queued progress update has been written"""
+    if _progress_writer_thread is not None:
+        _progress_queue.join()
+
+# Don't lose the last updates when the process exits right after training
+atexit.register(_flush_progress)
+
+def _run_in_daemon_thread(fn, *args) -> Future:
+    """Call fn on a daemon thread, returning a Future for its result
+    
+    Unlike ThreadPoolExecutor workers the thread isn't joined at interpreter exit,
+    so an abandoned call (a hung download, or one nobody waits for after an error)
+    can't keep the process alive.
+    """
+    future = Future()
+    
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+    
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+# Progress updates that never change, serialised once at import time
+PROGRESS_KBIT_PREP = _progress_line({
+    "stage": "Preparing model for training",
+    "percentage": 50,
+    "message": "Preparing model for k-bit training..."
+})
+PROGRESS_MODEL_READY = _progress_line({
+    "stage": "Model preparation complete",
+    "percentage": 60,
+    "message": "Model loaded and prepared successfully for fine-tuning!"
+})
+
 class FineTuningManager:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
         self.fine_tuned_models_dir = Path("./fine_tuned_models")
         self.fine_tuned_models_dir.mkdir(exist_ok=True)
+        self.tokenized_cache_dir = self.fine_tuned_models_dir / "cache"
+        self.tokenized_cache_dir.mkdir(exist_ok=True)
+        
+        # Lookup caches for repeated fine-tune attempts on the same model
+        self._known_ollama_models = set()  # Only positive results are cached
+        self._hf_equivalent_cache = {}
+        self._gpu_info = None  # Filled lazily from NVML / nvidia-smi
+        self._bnb_gpu_support = None  # Checked once fine-tuning starts
+        self._ram_gb = None
+        self._requirements_cache = None  # (monotonic time, result) of the last check
+        # Highest percentage emitted this run; the tokenizer and model download
+        # tickers run side by side and must not move the bar backwards
+        self._progress_pct = 0
+        self._progress_lock = threading.Lock()
         
     def check_system_requirements(self) -> Dict:
-        """Check if the system can handle fine-tuning using built-in modules only"""
+        """Check if the system can handle fine-tuning using built-in modules only
+        
+        Results are reused for SYSTEM_REQUIREMENTS_TTL seconds so UI refreshes
+        don't re-run the probes.
+        """
+        if self._requirements_cache is not None:
+            checked_at, requirements = self._requirements_cache
+            if time.monotonic() - checked_at < SYSTEM_REQUIREMENTS_TTL:
+                return dict(requirements)
+        
         try:
             # Get RAM information (cross-platform)
             ram_gb = self._get_ram_gb()
             
-            # Get storage information (built-in)
-            storage_gb = shutil.disk_usage('/').free / (1024**3)
+            # Get storage information (built-in) for where the adapters are written
+            # and where Hugging Face downloads the base model, which may be different disks
+            storage_gb = self._get_free_space_gb(self.fine_tuned_models_dir)
+            hf_cache_storage_gb = self._get_free_space_gb(self._get_hf_cache_dir())
             
             # Check GPU availability (lightweight)
             gpu_available, gpu_memory_gb = self._check_gpu()
@@ -65,29 +387,55 @@ class FineTuningManager:
             can_fine_tune = (
                 ram_gb >= 8 and  # Minimum 8GB RAM
                 storage_gb >= 5 and  # Minimum 5GB free space
+                hf_cache_storage_gb >= 5 and  # Room for the base model download
                 (gpu_available or ram_gb >= 16)  # GPU or 16GB+ RAM
             )
             
-            return {
+            requirements = {
                 "ram_gb": ram_gb,
                 "storage_gb": storage_gb,
+                "hf_cache_storage_gb": hf_cache_storage_gb,
                 "gpu_available": gpu_available,
                 "gpu_memory_gb": gpu_memory_gb,
                 "can_fine_tune": can_fine_tune
             }
+            self._requirements_cache = (time.monotonic(), requirements)
+            return dict(requirements)
             
         except Exception as e:
             self.logger.error(f"Error checking system requirements: {e}")
             return {
                 "ram_gb": 0,
                 "storage_gb": 0,
+                "hf_cache_storage_gb": 0,
                 "gpu_available": False,
                 "gpu_memory_gb": 0,
                 "can_fine_tune": False,
                 "error": str(e)
             }
     
+    def _get_free_space_gb(self, path) -> float:
+        """Free space in GB on the volume holding path (which may not exist yet)"""
+        path = Path(path).expanduser().resolve()
+        while not path.exists() and path != path.parent:
+            path = path.parent
+        return shutil.disk_usage(path).free / (1024**3)
+    
+    def _get_hf_cache_dir(self) -> str:
+        """Directory Hugging Face downloads models into"""
+        try:
+            from huggingface_hub.constants import HF_HUB_CACHE
+            return HF_HUB_CACHE
+        except ImportError:
+            return os.path.join(os.path.expanduser("~"), ".cache", "huggingface", "hub")
+    
     def _get_ram_gb(self) -> float:
+        """Get RAM in GB (installed memory doesn't change, so it is looked up once)"""
+        if self._ram_gb is None:
+            self._ram_gb = self._read_ram_gb()
+        return self._ram_gb
+    
+    def _read_ram_gb(self) -> float:
         """Get RAM in GB using platform-specific methods"""
         try:
             if platform.system() == "Windows":
@@ -101,13 +449,12 @@ class FineTuningManager:
                         return memory_kb / 1024  # Convert to GB
                         
             elif platform.system() == "Linux":
-                # Linux: read from /proc/meminfo
-                with open('/proc/meminfo', 'r') as f:
-                    meminfo = f.read()
-                    for line in meminfo.split('\n'):
-                        if 'MemTotal' in line:
-                            memory_kb = int(line.split()[1])
-                            return memory_kb / 1024 / 1024  # Convert to GB
+                # Linux: MemTotal is the first line of /proc/meminfo
+                with open('/proc/meminfo', 'rb') as f:
+                    head = f.read(64)
+                if head.startswith(b'MemTotal:'):
+                    memory_kb = int(head.split()[1])
+                    return memory_kb / 1024 / 1024  # Convert to GB
                             
             elif platform.system() == "Darwin":  # macOS
                 # macOS: use sysctl command
@@ -123,47 +470,61 @@ class FineTuningManager:
         # Fallback: return a conservative estimate
         return 8.0
     
-    def _check_gpu(self) -> Tuple[bool, float]:
-        """Check GPU availability using nvidia-smi"""
+    def _probe_gpu(self) -> Dict:
+        """Get GPU facts via NVML / nvidia-smi (cached per manager)
+        
+        These checks never import torch, so they are cheap enough for the UI.
+        """
+        if self._gpu_info is None:
+            gpu_available, gpu_memory_gb = gpu_probe.check_gpu()
+            self._gpu_info = {
+                "gpu_available": gpu_available,
+                "gpu_memory_gb": gpu_memory_gb,
+                "gpu_type": gpu_probe.check_gpu_type()
+            }
+        return self._gpu_info
+    
+    def _run_bnb_probe(self) -> Optional[bool]:
+        """Run gpu_probe.py in a child process so CUDA memory is released on exit
+        
+        Returns None when the probe couldn't give an answer (e.g. it timed out
+        on a cold torch import), which is not the same as "unsupported".
+        """
         try:
-            # Try to run nvidia-smi to check for NVIDIA GPU
-            result = subprocess.run(['nvidia-smi', '--query-gpu=memory.total', '--format=csv,noheader,nounits'], 
-                                  capture_output=True, text=True, timeout=5)
-            
+            result = subprocess.run([sys.executable, GPU_PROBE_SCRIPT],
+                                  capture_output=True, text=True, timeout=15)
             if result.returncode == 0:
-                # Parse GPU memory
-                gpu_memory_mb = float(result.stdout.strip())
-                gpu_memory_gb = gpu_memory_mb / 1024
-                return True, gpu_memory_gb
-            else:
-                return False, 0
-                
-        except (subprocess.TimeoutExpired, FileNotFoundError, Exception) as e:
-            self.logger.debug(f"GPU check failed (this is normal if no GPU): {e}")
-            return False, 0
+                # torch/bitsandbytes may print banners first; the JSON is the last line
+                return json.loads(result.stdout.strip().splitlines()[-1])["bnb_gpu_support"]
+            self.logger.warning(f"bitsandbytes probe exited with code {result.returncode}: {result.stderr.strip()}")
+        except (subprocess.TimeoutExpired, OSError, ValueError, IndexError, KeyError) as e:
+            self.logger.warning(f"bitsandbytes probe failed: {e}")
+        return None
+    
+    def _check_gpu(self) -> Tuple[bool, float]:
+        """Check GPU availability"""
+        gpu_info = self._probe_gpu()
+        return gpu_info["gpu_available"], gpu_info["gpu_memory_gb"]
+    
+    def _check_bnb_gpu_support(self) -> bool:
+        """Check if bitsandbytes can use the GPU (only called once fine-tuning starts)"""
+        if self._bnb_gpu_support is None:
+            if not self._probe_gpu()["gpu_available"]:
+                self._bnb_gpu_support = False
+                return False
+            
+            bnb_gpu_support = self._run_bnb_probe()
+            if bnb_gpu_support is None:
+                # Unknown rather than unsupported: the training run has already imported
+                # torch and bitsandbytes and is about to use the GPU, so ask directly
+                self.logger.info("Checking bitsandbytes GPU support in-process")
+                bnb_gpu_support = gpu_probe.check_bnb_gpu_support()
+            self._bnb_gpu_support = bnb_gpu_support
+        return self._bnb_gpu_support
     
     def _check_gpu_type(self) -> str:
         """Check what type of GPU is available"""
-        try:
-            # Check for NVIDIA GPU
-            result = subprocess.run(['nvidia-smi'], capture_output=True, text=True, timeout=5)
-            if result.returncode == 0:
-                return "nvidia"
-            
-            # Check for Intel GPU
-            result = subprocess.run(['lspci'], capture_output=True, text=True, timeout=5)
-            if result.returncode == 0 and 'Intel' in result.stdout and 'VGA' in result.stdout:
-                return "intel"
-            
-            # Check for AMD GPU
-            result = subprocess.run(['lspci'], capture_output=True, text=True, timeout=5)
-            if result.returncode == 0 and 'AMD' in result.stdout and 'VGA' in result.stdout:
-                return "amd"
-                
-        except Exception as e:
-            self.logger.debug(f"GPU type check failed: {e}")
-        
-        return "none"
+        return self._probe_gpu()["gpu_type"]
     
     def validate_training_data(self, files: List[str]) -> Tuple[bool, str]:
         """Validate uploaded training data"""
@@ -171,146 +532,473 @@ class FineTuningManager:
             return False, "No training files provided"
         
         total_size = 0
-        valid_extensions = {'.txt', '.md', '.json', '.csv', '.docx', '.pdf'}
-        
+
         for file_path in files:
-            if not os.path.exists(file_path):
-                return False, f"File not found: {file_path}"
-            
-            file_ext = Path(file_path).suffix.lower()
-            if file_ext not in valid_extensions:
+            # Pure string check first, so rejected files cost no syscall
+            file_ext = os.path.splitext(file_path)[1].lower()
+            if file_ext not in VALID_TRAINING_EXTENSIONS:
                 return False, f"Unsupported file type: {file_ext}"
-            
-            total_size += os.path.getsize(file_path)
-        
-        # Check if total size is reasonable (max 100MB)
-        if total_size > 100 * 1024 * 1024:
-            return False, "Total file size exceeds 100MB limit"
-        
+
+            # Single stat per file gives us both existence and size
+            try:
+                st = os.stat(file_path)
+            except FileNotFoundError:
+                return False, f"File not found: {file_path}"
+
+            total_size += st.st_size
+
+            # Check if total size is reasonable (max 100MB), bail out early
+            if total_size > MAX_TRAINING_DATA_BYTES:
+                return False, "Total file size exceeds 100MB limit"
+
         return True, "Training data validation passed"
     
     def prepare_training_data(self, files: List[dict]) -> str:
-        """Convert uploaded files into training dataset format"""
+        """Convert uploaded files into training dataset format and save it as JSON
+        
+        Each file is either {"name", "content"} with its text already loaded, or
+        {"name", "path"} so large files are streamed from disk instead.
+        """
+        return self._save_training_data(self._collect_training_texts(files))
+    
+    def _collect_training_texts(self, files: List[dict]) -> List[dict]:
+        """Parse uploaded files into {"text": ...} training examples"""
+        training_texts = [text for file_data in files for text in self._parse_training_file(file_data)]
+        
+        self.logger.info(f"Prepared {len(training_texts)} training examples")
+        return training_texts
+    
+    def _save_training_data(self, training_texts: List[dict]) -> str:
+        """Write training examples to fine_tuned_models/training_data.json"""
+        training_data_path = self.fine_tuned_models_dir / "training_data.json"
+        training_data_path.write_bytes(_json_bytes(training_texts))
+        return str(training_data_path)
+    
+    def _parse_training_file(self, file_data: dict) -> List[dict]:
+        """Turn one uploaded file into training examples, logging (not raising) parse errors"""
         training_texts = []
         
-        for file_data in files:
-            try:
-                file_name = file_data.get('name', 'unknown')
-                file_content = file_data.get('content', '')
-                file_ext = Path(file_name).suffix.lower()
-                
-                if file_ext == '.txt' or file_ext == '.md':
-                    # Split into chunks for better training
-                    chunks = self._split_text_into_chunks(file_content, max_length=1000)
-                    for chunk in chunks:
-                        training_texts.append({
-                            "text": f"### Instruction:\n{chunk}\n\n### Response:\nThe model will learn to respond appropriately to this type of content."
-                        })
-                
-                elif file_ext == '.json':
-                    try:
-                        data = json.loads(file_content)
-                        # Handle different JSON formats
-                        if isinstance(data, list):
-                            for item in data:
-                                if isinstance(item, dict):
-                                    # Extract text from various possible keys
-                                    text = item.get('text', item.get('content', item.get('instruction', str(item))))
-                                    training_texts.append({
-                                        "text": f"### Instruction:\n{text}\n\n### Response:\nThe model will learn to respond appropriately."
-                                    })
-                        elif isinstance(data, dict):
-                            text = str(data)
-                            training_texts.append({
-                                "text": f"### Instruction:\n{text}\n\n### Response:\nThe model will learn to respond appropriately."
-                            })
-                    except json.JSONDecodeError as e:
-                        self.logger.error(f"Error parsing JSON file {file_name}: {e}")
-                        continue
-                
-                elif file_ext == '.csv':
-                    import csv
-                    from io import StringIO
-                    try:
-                        csv_file = StringIO(file_content)
-                        reader = csv.DictReader(csv_file)
-                        for row in reader:
-                            # Combine all columns into a single text
-                            text = ' '.join([f"{k}: {v}" for k, v in row.items()])
-                            training_texts.append({
-                                "text": f"### Instruction:\n{text}\n\n### Response:\nThe model will learn to respond appropriately to this data."
-                            })
-                    except Exception as e:
-                        self.logger.error(f"Error parsing CSV file {file_name}: {e}")
-                        continue
-                
+        try:
+            file_name = file_data.get('name', 'unknown')
+            file_path = file_data.get('path')
+            file_ext = Path(file_name).suffix.lower()
+            
+            if file_ext == '.txt' or file_ext == '.md':
+                # Split into chunks for better training
+                if file_path:
+                    chunks = self._iter_text_chunks(self._iter_file_words(file_path), max_length=1000)
                 else:
-                    # For other file types, use content as-is
+                    chunks = self._split_text_into_chunks(file_data.get('content', ''), max_length=1000)
+                for chunk in chunks:
                     training_texts.append({
-                        "text": f"### Instruction:\n{file_content}\n\n### Response:\nThe model will learn to respond appropriately."
+                        "text": f"{INSTRUCTION_PREFIX}{chunk}{TEXT_RESPONSE_SUFFIX}"
                     })
-                        
-            except Exception as e:
-                self.logger.error(f"Error processing file {file_data.get('name', 'unknown')}: {e}")
-                continue
+            
+            elif file_ext == '.json':
+                try:
+                    for text in self._iter_json_texts(file_data):
+                        training_texts.append({
+                            "text": f"{INSTRUCTION_PREFIX}{text}{DEFAULT_RESPONSE_SUFFIX}"
+                        })
+                except json.JSONDecodeError as e:
+                    self.logger.error(f"Error parsing JSON file {file_name}: {e}")
+            
+            elif file_ext == '.csv':
+                try:
+                    for text in self._iter_csv_texts(file_data):
+                        training_texts.append({
+                            "text": f"{INSTRUCTION_PREFIX}{text}{DATA_RESPONSE_SUFFIX}"
+                        })
+                except Exception as e:
+                    self.logger.error(f"Error parsing CSV file {file_name}: {e}")
+            
+            else:
+                # For other file types, use content as-is
+                if file_path:
+                    with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+                        file_content = f.read()
+                else:
+                    file_content = file_data.get('content', '')
+                training_texts.append({
+                    "text": f"{INSTRUCTION_PREFIX}{file_content}{DEFAULT_RESPONSE_SUFFIX}"
+                })
         
-        # Save training data to temporary file
-        training_data_path = self.fine_tuned_models_dir / "training_data.json"
-        with open(training_data_path, 'w', encoding='utf-8') as f:
-            json.dump(training_texts, f, indent=2)
+        except Exception as e:
+            self.logger.error(f"Error processing file {file_data.get('name', 'unknown')}: {e}")
         
-        self.logger.info(f"Prepared {len(training_texts)} training examples")
-        return str(training_data_path)
+        return training_texts
+    
+    def _iter_file_words(self, file_path: str) -> Iterator[str]:
+        """Stream whitespace-separated words from a text file in fixed-size blocks"""
+        with open(file_path, 'r', encoding='utf-8', errors='replace', buffering=READ_BUFFER_SIZE) as f:
+            tail = ''
+            while True:
+                block = f.read(READ_BUFFER_SIZE)
+                if not block:
+                    break
+                words = (tail + block).split()
+                # The last word may continue in the next block
+                tail = '' if block[-1].isspace() or not words else words.pop()
+                yield from words
+            if tail:
+                yield tail
+    
+    def _iter_json_texts(self, file_data: dict) -> Iterator[str]:
+        """Yield the training text for each record in a JSON file"""
+        file_path = file_data.get('path')
+        if file_path:
+            with open(file_path, 'rb') as f:
+                # Top-level arrays are parsed incrementally when ijson is installed
+                if ijson is not None and f.read(64).lstrip()[:1] == b'[':
+                    f.seek(0)
+                    # Numbers as float, like json.load, rather than Decimal
+                    yield from self._json_item_texts(ijson.items(f, 'item', use_float=True))
+                    return
+                f.seek(0)
+                data = json.load(f)
+        else:
+            data = json.loads(file_data.get('content', ''))
+        
+        # Handle different JSON formats
+        if isinstance(data, list):
+            yield from self._json_item_texts(data)
+        elif isinstance(data, dict):
+            yield str(data)
+    
+    def _json_item_texts(self, items) -> Iterator[str]:
+        """Extract text from the dict records of a JSON array"""
+        for item in items:
+            if isinstance(item, dict):
+                # Extract text from various possible keys
+                yield item.get('text', item.get('content', item.get('instruction', str(item))))
+    
+    def _iter_csv_texts(self, file_data: dict) -> Iterator[str]:
+        """Yield one "column: value" line per CSV row"""
+        if pa is None:
+            yield from self._iter_csv_dict_texts(file_data)
+            return
+        
+        rows_done = 0
+        try:
+            for text in self._iter_arrow_csv_texts(file_data):
+                yield text
+                rows_done += 1
+            return
+        except pa.ArrowInvalid as e:
+            # e.g. ragged rows; the csv module is more forgiving
+            self.logger.warning(f"Arrow could not parse {file_data.get('name', 'unknown')}, using the csv module: {e}")
+        yield from itertools.islice(self._iter_csv_dict_texts(file_data), rows_done, None)
+    
+    def _open_csv_text(self, file_data: dict):
+        """Open an uploaded CSV as text, dropping any UTF-8 byte order mark"""
+        from io import StringIO
+        file_path = file_data.get('path')
+        if file_path:
+            return open(file_path, 'r', encoding='utf-8-sig', newline='', buffering=READ_BUFFER_SIZE)
+        return StringIO(file_data.get('content', '').lstrip('\ufeff'))
+    
+    def _iter_csv_dict_texts(self, file_data: dict) -> Iterator[str]:
+        """Row texts via csv.DictReader"""
+        import csv
+        with self._open_csv_text(file_data) as csv_file:
+            for row in csv.DictReader(csv_file):
+                # Combine all columns into a single text
+                yield ' '.join([f"{k}: {v}" for k, v in row.items()])
+    
+    def _iter_arrow_csv_texts(self, file_data: dict) -> Iterator[str]:
+        """Row texts via pyarrow's multithreaded CSV reader"""
+        import csv
+        from io import BytesIO
+        
+        # Read the header ourselves so every column stays a string, like csv.DictReader
+        with self._open_csv_text(file_data) as csv_file:
+            header = next(csv.reader(csv_file), None)
+        if not header:
+            return
+        
+        file_path = file_data.get('path')
+        source = file_path if file_path else BytesIO(file_data.get('content', '').encode('utf-8'))
+        reader = pacsv.open_csv(
+            source,
+            read_options=pacsv.ReadOptions(block_size=8 << 20),
+            # Quoted fields may span lines, as csv.DictReader allows
+            parse_options=pacsv.ParseOptions(newlines_in_values=True),
+            convert_options=pacsv.ConvertOptions(column_types={name: pa.string() for name in header})
+        )
+        prefixes = [f"{name}: " for name in reader.schema.names]
+        for batch in reader:
+            # Build the row texts a whole column at a time
+            columns = [
+                pc.binary_join_element_wise(prefix, pc.fill_null(column, ''), '')
+                for prefix, column in zip(prefixes, batch.columns)
+            ]
+            yield from pc.binary_join_element_wise(*columns, ' ').to_pylist()
     
     def _split_text_into_chunks(self, text: str, max_length: int = 1000) -> List[str]:
         """Split text into smaller chunks for training"""
         words = text.split()
+        if np is None or not words:
+            return list(self._iter_text_chunks(words, max_length))
+        
+        # Same greedy packing as _iter_text_chunks, but each chunk boundary is found
+        # with a binary search over prefix sums instead of a Python step per word.
+        # cost[k] is the length of words[:k] with one separator after each word.
+        cost = np.zeros(len(words) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, words), dtype=np.int64, count=len(words)) + 1, out=cost[1:])
+        
         chunks = []
+        start = 0
+        # A chunk that begins after an overflow starts counted at len(word), not len(word) + 1
+        carried = False
+        while start < len(words):
+            budget = cost[start] + max_length + (1 if carried else 0)
+            # First word that no longer fits in this chunk
+            end = int(np.searchsorted(cost, budget, side='right')) - 1
+            if carried:
+                end = max(end, start + 1)
+            if end >= len(words):
+                chunks.append(' '.join(words[start:]))
+                break
+            if end == start:
+                # Single word is too long, truncate it
+                chunks.append(words[start][:max_length])
+                start += 1
+                carried = False
+            else:
+                chunks.append(' '.join(words[start:end]))
+                start = end
+                carried = True
+        
+        return chunks
+    
+    def _iter_text_chunks(self, words: Iterable[str], max_length: int = 1000) -> Iterator[str]:
+        """Group a stream of words into chunks of at most max_length characters"""
         current_chunk = []
         current_length = 0
         
         for word in words:
             if current_length + len(word) + 1 > max_length:
                 if current_chunk:
-                    chunks.append(' '.join(current_chunk))
+                    yield ' '.join(current_chunk)
                     current_chunk = [word]
                     current_length = len(word)
                 else:
                     # Single word is too long, truncate it
-                    chunks.append(word[:max_length])
+                    yield word[:max_length]
             else:
                 current_chunk.append(word)
                 current_length += len(word) + 1
         
         if current_chunk:
-            chunks.append(' '.join(current_chunk))
-        
-        return chunks
+            yield ' '.join(current_chunk)
     
-    def setup_lora_config(self) -> Dict:
+    def setup_lora_config(self, model=None) -> Dict:
         """Configure LoRA parameters for efficient fine-tuning"""
+        target_modules = self._detect_lora_target_modules(model) if model is not None else None
         return {
             "task_type": TaskType.CAUSAL_LM,
             "inference_mode": False,
             "r": 8,  # Rank
             "lora_alpha": 32,
             "lora_dropout": 0.1,
-            "target_modules": ["q_proj", "v_proj", "k_proj", "o_proj"],  # Which layers to adapt
+            "target_modules": target_modules or DEFAULT_LORA_TARGET_MODULES,  # Which layers to adapt
             "bias": "none"
         }
     
+    def _detect_lora_target_modules(self, model) -> List[str]:
+        """Attention projection layer names present in the loaded model"""
+        # GPT-2 style models implement their projections as Conv1D rather than Linear
+        from transformers.pytorch_utils import Conv1D
+        
+        adaptable = (torch.nn.Linear, Conv1D)
+        target_modules = sorted({
+            name.rsplit('.', 1)[-1]
+            for name, module in model.named_modules()
+            if isinstance(module, adaptable) and name.rsplit('.', 1)[-1] in LORA_TARGET_KEYWORDS
+        })
+        if not target_modules:
+            self.logger.warning("No known attention projections found, using default LoRA target modules")
+        return target_modules
+    
+    def _emit_progress(self, stage: str, percentage: int, message: str) -> None:
+        """Print a progress update (captured by main.js and forwarded to the UI)"""
+        with self._progress_lock:
+            self._progress_pct = max(self._progress_pct, percentage)
+            _write_progress_line({
+                "stage": stage,
+                "percentage": self._progress_pct,
+                "message": message
+            })
+    
+    def _download_with_retries(self, fn, *, stage: str, label: str, start_pct: int, end_pct: int,
+                               timeout: int, retry_delay: int, update_interval: int,
+                               description: str = None, max_retries: int = 3, local_first: bool = False):
+        """Run a Hugging Face download with retries, a wall-clock timeout and progress updates
+        
+        fn is called with local_files_only and returns the loaded object. With
+        local_first the local HF cache is tried first; if that fails the Hub is tried
+        straight away, without using up a retry. The wait between retries starts at
+        retry_delay and doubles each time, with random jitter of up to half the wait.
+        """
+        description = description or f"Downloading {label}"
+        
+        attempt = 0
+        local_files_only = local_first
+        while True:
+            progress_stopped = threading.Event()
+            
+            def progress_updater():
+                progress = start_pct
+                while progress < end_pct:
+                    self._emit_progress(stage, progress, f"Downloading {label} files... ({progress - start_pct}%)")
+                    progress += 1
+                    if progress_stopped.wait(update_interval):
+                        break
+            
+            try:
+                self._emit_progress(stage, start_pct, f"{description}... (attempt {attempt + 1}/{max_retries})")
+                threading.Thread(target=progress_updater, daemon=True).start()
+                
+                # Portable timeout: SIGALRM is Unix-only and main-thread-only
+                try:
+                    print(f"DEBUG: Starting {label} download (attempt {attempt + 1}/{max_retries})")
+                    # A hung download is abandoned on its daemon thread, not joined
+                    result = _run_in_daemon_thread(fn, local_files_only).result(timeout=timeout)
+                    print(f"DEBUG: {label.capitalize()} download completed successfully")
+                except FuturesTimeoutError:
+                    raise Exception(
+                        f"{label.capitalize()} download timed out after {timeout // 60} minutes. "
+                        f"Please check your internet connection."
+                    )
+                finally:
+                    progress_stopped.set()  # Stop progress updates
+                
+                self._emit_progress(stage, end_pct, f"{label.capitalize()} download completed successfully!")
+                return result
+                
+            except Exception as e:
+                print(f"DEBUG: {label.capitalize()} download failed with error: {str(e)}")
+                if local_files_only:
+                    # The cached copy is incomplete or stale: not a failed download,
+                    # so go to the Hub now rather than counting it and backing off
+                    local_files_only = False
+                    continue
+                if attempt < max_retries - 1:
+                    # Back off exponentially so a struggling Hub isn't hammered, with
+                    # jitter so several machines rate-limited together don't retry in lockstep
+                    delay = min(MAX_RETRY_DELAY, retry_delay * 2 ** attempt)
+                    delay = random.uniform(delay / 2, delay)
+                    self._emit_progress(
+                        stage, start_pct,
+                        f"{label.capitalize()} download attempt {attempt + 1} failed, "
+                        f"retrying in {delay:.0f} seconds... ({str(e)[:100]})"
+                    )
+                    time.sleep(delay)  # Wait before retry
+                    attempt += 1
+                else:
+                    raise
+    
+    def _get_precision_args(self) -> Dict:
+        """Pick mixed-precision TrainingArguments for the detected hardware"""
+        gpu_available, _ = self._check_gpu()
+        if not (gpu_available and torch.cuda.is_available()):
+            # Mixed precision training needs a CUDA device
+            return {"bf16": False, "fp16": False}
+        
+        if self._supports_bf16():
+            return {"bf16": True, "fp16": False}
+        return {"bf16": False, "fp16": True}
+    
+    def _get_compile_args(self, model) -> Dict:
+        """Let the Trainer torch.compile the model where that is known to work
+        
+        Compilation goes through TrainingArguments rather than wrapping the model
+        ourselves, so trainer.save_model still sees the PEFT model and writes the adapter.
+        """
+        gpu_available, _ = self._check_gpu()
+        if not (gpu_available and torch.cuda.is_available() and hasattr(torch, "compile")):
+            return {}
+        if platform.system() == "Windows":
+            # Inductor needs Triton, which has no official Windows wheels
+            return {}
+        if getattr(model, "is_quantized", False):
+            # bitsandbytes 4-bit layers cause graph breaks that cost more than they save
+            return {}
+        # CUDA graphs ("reduce-overhead") don't mix with gradient checkpointing's recompute,
+        # so use the default mode, which still fuses the attention/MLP kernels
+        return {"torch_compile": True, "torch_compile_mode": "default"}
+    
+    def _get_max_memory(self) -> Optional[Dict]:
+        """Memory budget for device_map="auto" based on what is actually free right now"""
+        if not torch.cuda.is_available():
+            # nvidia-smi sees a GPU but this torch build can't; keep transformers' defaults
+            return None
+        # Budget every visible GPU, or accelerate offloads to CPU rather than using GPUs 1..N.
+        # Headroom on each GPU for activations, optimizer state and the CUDA context
+        max_memory = {
+            i: int(torch.cuda.mem_get_info(i)[0] * 0.9)
+            for i in range(torch.cuda.device_count())
+        }
+        if psutil is not None:
+            cpu_bytes = psutil.virtual_memory().available
+        else:
+            cpu_bytes = self._get_ram_gb() * (1024**3)
+        max_memory["cpu"] = int(cpu_bytes * 0.5)
+        return max_memory
+    
+    def _get_device_map(self) -> Dict:
+        """Device placement for the 4-bit model
+        
+        With a single GPU there is nothing to plan: pin every module to device 0 and
+        skip accelerate's size-and-place pass over all parameters.
+        """
+        if torch.cuda.device_count() == 1:
+            return {"device_map": {"": 0}}
+        return {"device_map": "auto", "max_memory": self._get_max_memory()}
+    
+    def _get_attn_args(self, huggingface_model: str) -> Dict:
+        """Use FlashAttention-2 kernels when installed and supported by the GPU"""
+        # flash-attn needs Ampere or newer; built-in architectures all implement it
+        if (importlib.util.find_spec("flash_attn") is not None
+                and self._supports_bf16()
+                and not self._needs_remote_code(huggingface_model)):
+            return {"attn_implementation": "flash_attention_2"}
+        return {}
+    
+    def _supports_bf16(self) -> bool:
+        """Ampere (compute capability 8.x) and newer GPUs run bf16 natively on tensor cores"""
+        return torch.cuda.is_available() and torch.cuda.get_device_capability()[0] >= 8
+    
+    def _load_tokenizer(self, huggingface_model: str):
+        """Download the tokenizer from Hugging Face (runs on a worker thread)"""
+        tokenizer = self._download_with_retries(
+            lambda local_files_only: AutoTokenizer.from_pretrained(
+                huggingface_model,
+                trust_remote_code=self._needs_remote_code(huggingface_model),
+                use_fast=True,  # Use fast tokenizer when possible
+                local_files_only=local_files_only
+            ),
+            stage="Loading tokenizer", label="tokenizer", start_pct=30, end_pct=35,
+            timeout=300, retry_delay=5, update_interval=3,
+            # Serve from the local HF cache first, hit the Hub if that fails
+            local_first=self._is_in_hf_cache(huggingface_model, HF_TOKENIZER_FILES)
+        )
+        
+        if not tokenizer.is_fast:
+            # Slow tokenizers do BPE merges in Python; dataset prep will be much slower
+            self.logger.warning(f"No fast tokenizer available for {huggingface_model}, using the Python implementation")
+        
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        return tokenizer
+    
     def _prepare_model_for_training(self, model_name: str) -> Tuple:
         """Load and prepare model for LoRA fine-tuning using Hugging Face models"""
         try:
             self.logger.info(f"Preparing model '{model_name}' for fine-tuning...")
             
-            # Send progress update
-            progress_data = {
-                "stage": "Checking model availability",
-                "percentage": 10,
-                "message": f"Checking if model '{model_name}' is available in Ollama..."
-            }
-            print(f"PROGRESS_UPDATE: {json.dumps(progress_data)}")
+            self._emit_progress("Checking model availability", 10,
+                                f"Checking if model '{model_name}' is available in Ollama...")
             
             # Check if the model exists in Ollama first
             model_exists = self._check_ollama_model_exists(model_name)
@@ -321,15 +1009,8 @@ class FineTuningManager:
                     f"Please download it first using: ollama pull {model_name}"
                 )
             
-
-            
-            # Send progress update
-            progress_data = {
-                "stage": "Detecting Hugging Face equivalent",
-                "percentage": 20,
-                "message": f"Finding Hugging Face equivalent for '{model_name}'..."
-            }
-            print(f"PROGRESS_UPDATE: {json.dumps(progress_data)}")
+            self._emit_progress("Detecting Hugging Face equivalent", 20,
+                                f"Finding Hugging Face equivalent for '{model_name}'...")
             
             # For the hybrid approach, we use Hugging Face models for fine-tuning
             # but check Ollama for availability first
@@ -337,449 +1018,120 @@ class FineTuningManager:
             
             self.logger.info(f"Using Hugging Face model: {huggingface_model}")
             
-            # Send progress update
-            progress_data = {
-                "stage": "Loading tokenizer",
-                "percentage": 30,
-                "message": f"Loading tokenizer for {huggingface_model}..."
-            }
-            print(f"PROGRESS_UPDATE: {json.dumps(progress_data)}")
+            # Fail now rather than after a multi-GB download (or an OOM while loading)
+            self._check_model_resources(huggingface_model)
             
-            # Load tokenizer and model from Hugging Face with retry mechanism
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    # Add progress callback for tokenizer download
-                    progress_data = {
-                        "stage": "Loading tokenizer",
-                        "percentage": 30,
-                        "message": f"Downloading tokenizer from Hugging Face... (attempt {attempt + 1}/{max_retries})"
-                    }
-                    print(f"PROGRESS_UPDATE: {json.dumps(progress_data)}")
-                    
-                    # Send initial progress update
-                    progress_data = {
-                        "stage": "Loading tokenizer",
-                        "percentage": 30,
-                        "message": f"Starting tokenizer download from Hugging Face... (attempt {attempt + 1}/{max_retries})"
-                    }
-                    print(f"PROGRESS_UPDATE: {json.dumps(progress_data)}")
-                    
-                    # Start background progress updates
-                    import threading
-                    import time
-                    
-                    progress_stopped = threading.Event()
-                    
-                    def progress_updater():
-                        progress = 30
-                        while not progress_stopped.is_set() and progress < 35:
-                            progress_data = {
-                                "stage": "Loading tokenizer",
-                                "percentage": progress,
-                                "message": f"Downloading tokenizer files... ({progress - 30}%)"
-                            }
-                            print(f"PROGRESS_UPDATE: {json.dumps(progress_data)}")
-                            progress += 1
-                            time.sleep(3)  # Update every 3 seconds
-                    
-                    progress_thread = threading.Thread(target=progress_updater, daemon=True)
-                    progress_thread.start()
-                    
-                    # Add timeout for tokenizer download
-                    import signal
-                    
-                    def timeout_handler(signum, frame):
-                        progress_stopped.set()
-                        raise TimeoutError("Tokenizer download timed out")
-                    
-                    # Set timeout to 5 minutes
-                    signal.signal(signal.SIGALRM, timeout_handler)
-                    signal.alarm(300)
-                    
-                    try:
-                        print(f"DEBUG: Starting tokenizer download for {huggingface_model}")
-                        tokenizer = AutoTokenizer.from_pretrained(
-                            huggingface_model,
-                            trust_remote_code=True,  # Allow custom tokenizer code
-                            use_fast=True  # Use fast tokenizer when possible
-                        )
-                        print(f"DEBUG: Tokenizer download completed successfully")
-                        signal.alarm(0)  # Cancel timeout
-                        progress_stopped.set()  # Stop progress updates
-                        
-                        progress_data = {
-                            "stage": "Loading tokenizer",
-                            "percentage": 35,
-                            "message": "Tokenizer download completed successfully!"
-                        }
-                        print(f"PROGRESS_UPDATE: {json.dumps(progress_data)}")
-                        
-                    except TimeoutError:
-                        signal.alarm(0)  # Cancel timeout
-                        progress_stopped.set()  # Stop progress updates
-                        raise Exception("Tokenizer download timed out after 5 minutes. Please check your internet connection.")
-                    except Exception as e:
-                        signal.alarm(0)  # Cancel timeout
-                        progress_stopped.set()  # Stop progress updates
-                        print(f"DEBUG: Tokenizer download failed with error: {str(e)}")
-                        raise e
-                    if tokenizer.pad_token is None:
-                        tokenizer.pad_token = tokenizer.eos_token
-                    
-                    progress_data = {
-                        "stage": "Loading tokenizer",
-                        "percentage": 35,
-                        "message": "Tokenizer download completed successfully!"
-                    }
-                    print(f"PROGRESS_UPDATE: {json.dumps(progress_data)}")
-                    break
-                except Exception as e:
-                    if attempt < max_retries - 1:
-                        progress_data = {
-                            "stage": "Loading tokenizer",
-                            "percentage": 30,
-                            "message": f"Download attempt {attempt + 1} failed, retrying in 5 seconds... ({str(e)[:100]})"
-                        }
-                        print(f"PROGRESS_UPDATE: {json.dumps(progress_data)}")
-                        time.sleep(5)  # Wait before retry
-                    else:
-                        raise e
+            self._emit_progress("Loading tokenizer", 30, f"Loading tokenizer for {huggingface_model}...")
             
-            # Send progress update
-            progress_data = {
-                "stage": "Loading model",
-                "percentage": 40,
-                "message": f"Loading model {huggingface_model}..."
-            }
-            print(f"PROGRESS_UPDATE: {json.dumps(progress_data)}")
+            # The tokenizer doesn't depend on the model weights, so download it on a
+            # worker thread while the (much larger) model download runs below
+            tokenizer_future = _run_in_daemon_thread(self._load_tokenizer, huggingface_model)
+            
+            self._emit_progress("Loading model", 40, f"Loading model {huggingface_model}...")
             
             # Check GPU availability and type
             gpu_available, gpu_memory_gb = self._check_gpu()
             gpu_type = self._check_gpu_type()
             
             # Check if bitsandbytes has GPU support
-            bnb_gpu_support = False
-            try:
-                import bitsandbytes as bnb
-                # Try to create a small tensor on GPU to test if bnb has GPU support
-                if gpu_available and torch.cuda.is_available():
-                    test_tensor = torch.zeros(1, device='cuda')
-                    bnb_gpu_support = True
-            except Exception:
-                bnb_gpu_support = False
+            bnb_gpu_support = self._check_bnb_gpu_support()
+            
+            description = "Downloading model"
             
             # For Intel/AMD GPUs or CPU-only, use CPU mode
             if gpu_type in ["intel", "amd"] or not gpu_available:
-                progress_data = {
-                    "stage": "Loading model",
-                    "percentage": 45,
-                    "message": f"Loading model with CPU (GPU type: {gpu_type.upper() if gpu_type != 'none' else 'CPU-only'})..."
-                }
-                print(f"PROGRESS_UPDATE: {json.dumps(progress_data)}")
-                
-                # CPU-only loading
-                max_retries = 3
-                for attempt in range(max_retries):
-                    try:
-                        progress_data = {
-                            "stage": "Loading model",
-                            "percentage": 45,
-                            "message": f"Downloading model... (attempt {attempt + 1}/{max_retries})"
-                        }
-                        print(f"PROGRESS_UPDATE: {json.dumps(progress_data)}")
-                        
-                        # Start background progress updates for model download
-                        progress_stopped = threading.Event()
-                        
-                        def model_progress_updater():
-                            progress = 45
-                            while not progress_stopped.is_set() and progress < 48:
-                                progress_data = {
-                                    "stage": "Loading model",
-                                    "percentage": progress,
-                                    "message": f"Downloading model files... ({progress - 45}%)"
-                                }
-                                print(f"PROGRESS_UPDATE: {json.dumps(progress_data)}")
-                                progress += 1
-                                time.sleep(5)  # Update every 5 seconds for model download
-                        
-                        model_progress_thread = threading.Thread(target=model_progress_updater, daemon=True)
-                        model_progress_thread.start()
-                        
-                        # Add timeout for model download
-                        def timeout_handler(signum, frame):
-                            progress_stopped.set()
-                            raise TimeoutError("Model download timed out")
-                        
-                        # Set timeout to 10 minutes for model download
-                        signal.signal(signal.SIGALRM, timeout_handler)
-                        signal.alarm(600)
-                        
-                        try:
-                            print(f"DEBUG: Starting model download for {huggingface_model}")
-                            model = AutoModelForCausalLM.from_pretrained(
-                                huggingface_model,
-                                torch_dtype=torch.float32,
-                                device_map="cpu",
-                                trust_remote_code=True  # Allow custom model code
-                            )
-                            print(f"DEBUG: Model download completed successfully")
-                            signal.alarm(0)  # Cancel timeout
-                            progress_stopped.set()  # Stop progress updates
-                            
-                            progress_data = {
-                                "stage": "Loading model",
-                                "percentage": 48,
-                                "message": "Model download completed successfully!"
-                            }
-                            print(f"PROGRESS_UPDATE: {json.dumps(progress_data)}")
-                            break
-                            
-                        except TimeoutError:
-                            signal.alarm(0)  # Cancel timeout
-                            progress_stopped.set()  # Stop progress updates
-                            raise Exception("Model download timed out after 10 minutes. Please check your internet connection.")
-                        except Exception as e:
-                            signal.alarm(0)  # Cancel timeout
-                            progress_stopped.set()  # Stop progress updates
-                            print(f"DEBUG: Model download failed with error: {str(e)}")
-                            raise e
-                    except Exception as e:
-                        if attempt < max_retries - 1:
-                            progress_data = {
-                                "stage": "Loading model",
-                                "percentage": 45,
-                                "message": f"Model download attempt {attempt + 1} failed, retrying in 10 seconds... ({str(e)[:100]})"
-                            }
-                            print(f"PROGRESS_UPDATE: {json.dumps(progress_data)}")
-                            time.sleep(10)  # Wait before retry
-                        else:
-                            raise e
+                self._emit_progress(
+                    "Loading model", 45,
+                    f"Loading model with CPU (GPU type: {gpu_type.upper() if gpu_type != 'none' else 'CPU-only'})..."
+                )
+                model_kwargs = {"torch_dtype": torch.float32, "device_map": "cpu"}
             elif gpu_available and gpu_memory_gb >= 4 and bnb_gpu_support:
                 # Use 4-bit quantization for GPU with proper bnb support
-                progress_data = {
-                    "stage": "Loading model",
-                    "percentage": 45,
-                    "message": f"Loading model with 4-bit quantization (GPU: {gpu_memory_gb:.1f}GB available)..."
-                }
-                print(f"PROGRESS_UPDATE: {json.dumps(progress_data)}")
+                self._emit_progress(
+                    "Loading model", 45,
+                    f"Loading model with 4-bit quantization (GPU: {gpu_memory_gb:.1f}GB available)..."
+                )
                 
                 from transformers import BitsAndBytesConfig
+                # QLoRA recipe: NF4 weights with double quantization, computing in bf16
+                # where the GPU supports it to match the bf16 training arguments
+                compute_dtype = torch.bfloat16 if self._supports_bf16() else torch.float16
                 quantization_config = BitsAndBytesConfig(
                     load_in_4bit=True,
-                    bnb_4bit_compute_dtype=torch.float16,
+                    bnb_4bit_compute_dtype=compute_dtype,
                     bnb_4bit_quant_type="nf4",
                     bnb_4bit_use_double_quant=True,
                 )
-                
-                # Retry mechanism for model loading
-                max_retries = 3
-                for attempt in range(max_retries):
-                    try:
-                        progress_data = {
-                            "stage": "Loading model",
-                            "percentage": 45,
-                            "message": f"Downloading model with 4-bit quantization... (attempt {attempt + 1}/{max_retries})"
-                        }
-                        print(f"PROGRESS_UPDATE: {json.dumps(progress_data)}")
-                        
-                        # Start background progress updates for model download
-                        progress_stopped = threading.Event()
-                        
-                        def model_progress_updater():
-                            progress = 45
-                            while not progress_stopped.is_set() and progress < 48:
-                                progress_data = {
-                                    "stage": "Loading model",
-                                    "percentage": progress,
-                                    "message": f"Downloading model files... ({progress - 45}%)"
-                                }
-                                print(f"PROGRESS_UPDATE: {json.dumps(progress_data)}")
-                                progress += 1
-                                time.sleep(5)  # Update every 5 seconds for model download
-                        
-                        model_progress_thread = threading.Thread(target=model_progress_updater, daemon=True)
-                        model_progress_thread.start()
-                        
-                        # Add timeout for model download
-                        def timeout_handler(signum, frame):
-                            progress_stopped.set()
-                            raise TimeoutError("Model download timed out")
-                        
-                        # Set timeout to 10 minutes for model download
-                        signal.signal(signal.SIGALRM, timeout_handler)
-                        signal.alarm(600)
-                        
-                        try:
-                            print(f"DEBUG: Starting model download for {huggingface_model}")
-                            model = AutoModelForCausalLM.from_pretrained(
-                                huggingface_model,
-                                torch_dtype=torch.float16,
-                                device_map="auto",
-                                quantization_config=quantization_config,
-                                trust_remote_code=True  # Allow custom model code
-                            )
-                            print(f"DEBUG: Model download completed successfully")
-                            signal.alarm(0)  # Cancel timeout
-                            progress_stopped.set()  # Stop progress updates
-                            
-                            progress_data = {
-                                "stage": "Loading model",
-                                "percentage": 48,
-                                "message": "Model download completed successfully!"
-                            }
-                            print(f"PROGRESS_UPDATE: {json.dumps(progress_data)}")
-                            break
-                            
-                        except TimeoutError:
-                            signal.alarm(0)  # Cancel timeout
-                            progress_stopped.set()  # Stop progress updates
-                            raise Exception("Model download timed out after 10 minutes. Please check your internet connection.")
-                        except Exception as e:
-                            signal.alarm(0)  # Cancel timeout
-                            progress_stopped.set()  # Stop progress updates
-                            print(f"DEBUG: Model download failed with error: {str(e)}")
-                            raise e
-                    except Exception as e:
-                        if attempt < max_retries - 1:
-                            progress_data = {
-                                "stage": "Loading model",
-                                "percentage": 45,
-                                "message": f"Model download attempt {attempt + 1} failed, retrying in 10 seconds... ({str(e)[:100]})"
-                            }
-                            print(f"PROGRESS_UPDATE: {json.dumps(progress_data)}")
-                            time.sleep(10)  # Wait before retry
-                        else:
-                            raise e
+                model_kwargs = {
+                    "torch_dtype": compute_dtype,
+                    **self._get_device_map(),
+                    **self._get_attn_args(huggingface_model),
+                    "quantization_config": quantization_config
+                }
+                description = "Downloading model with 4-bit quantization"
             else:
                 # Fallback to CPU or lower precision for limited GPU/no bnb GPU support
                 if gpu_available and not bnb_gpu_support:
-                    progress_data = {
-                        "stage": "Loading model",
-                        "percentage": 45,
-                        "message": f"Loading model with GPU but no 4-bit quantization (bitsandbytes GPU support not available)..."
-                    }
+                    message = "Loading model with GPU but no 4-bit quantization (bitsandbytes GPU support not available)..."
                 elif gpu_available:
-                    progress_data = {
-                        "stage": "Loading model",
-                        "percentage": 45,
-                        "message": f"Loading model with GPU fallback (GPU: {gpu_memory_gb:.1f}GB available)..."
-                    }
+                    message = f"Loading model with GPU fallback (GPU: {gpu_memory_gb:.1f}GB available)..."
                 else:
-                    progress_data = {
-                        "stage": "Loading model",
-                        "percentage": 45,
-                        "message": "Loading model with CPU (GPU not available)..."
-                    }
-                print(f"PROGRESS_UPDATE: {json.dumps(progress_data)}")
+                    message = "Loading model with CPU (GPU not available)..."
+                self._emit_progress("Loading model", 45, message)
                 
                 # Try to load with lower precision if GPU is available but limited
-                max_retries = 3
-                for attempt in range(max_retries):
-                    try:
-                        progress_data = {
-                            "stage": "Loading model",
-                            "percentage": 45,
-                            "message": f"Downloading model... (attempt {attempt + 1}/{max_retries})"
-                        }
-                        print(f"PROGRESS_UPDATE: {json.dumps(progress_data)}")
-                        
-                        # Start background progress updates for model download
-                        progress_stopped = threading.Event()
-                        
-                        def model_progress_updater():
-                            progress = 45
-                            while not progress_stopped.is_set() and progress < 48:
-                                progress_data = {
-                                    "stage": "Loading model",
-                                    "percentage": progress,
-                                    "message": f"Downloading model files... ({progress - 45}%)"
-                                }
-                                print(f"PROGRESS_UPDATE: {json.dumps(progress_data)}")
-                                progress += 1
-                                time.sleep(5)  # Update every 5 seconds for model download
-                        
-                        model_progress_thread = threading.Thread(target=model_progress_updater, daemon=True)
-                        model_progress_thread.start()
-                        
-                        # Add timeout for model download
-                        def timeout_handler(signum, frame):
-                            progress_stopped.set()
-                            raise TimeoutError("Model download timed out")
-                        
-                        # Set timeout to 10 minutes for model download
-                        signal.signal(signal.SIGALRM, timeout_handler)
-                        signal.alarm(600)
-                        
-                        try:
-                            print(f"DEBUG: Starting model download for {huggingface_model}")
-                            if gpu_available:
-                                model = AutoModelForCausalLM.from_pretrained(
-                                    huggingface_model,
-                                    torch_dtype=torch.float16,
-                                    device_map="auto",
-                                    trust_remote_code=True  # Allow custom model code
-                                )
-                            else:
-                                # CPU-only loading
-                                model = AutoModelForCausalLM.from_pretrained(
-                                    huggingface_model,
-                                    torch_dtype=torch.float32,
-                                    device_map="cpu",
-                                    trust_remote_code=True  # Allow custom model code
-                                )
-                            print(f"DEBUG: Model download completed successfully")
-                            signal.alarm(0)  # Cancel timeout
-                            progress_stopped.set()  # Stop progress updates
-                            
-                            progress_data = {
-                                "stage": "Loading model",
-                                "percentage": 48,
-                                "message": "Model download completed successfully!"
-                            }
-                            print(f"PROGRESS_UPDATE: {json.dumps(progress_data)}")
-                            break
-                            
-                        except TimeoutError:
-                            signal.alarm(0)  # Cancel timeout
-                            progress_stopped.set()  # Stop progress updates
-                            raise Exception("Model download timed out after 10 minutes. Please check your internet connection.")
-                        except Exception as e:
-                            signal.alarm(0)  # Cancel timeout
-                            progress_stopped.set()  # Stop progress updates
-                            print(f"DEBUG: Model download failed with error: {str(e)}")
-                            raise e
-                    except Exception as e:
-                        if attempt < max_retries - 1:
-                            progress_data = {
-                                "stage": "Loading model",
-                                "percentage": 45,
-                                "message": f"Model download attempt {attempt + 1} failed, retrying in 10 seconds... ({str(e)[:100]})"
-                            }
-                            print(f"PROGRESS_UPDATE: {json.dumps(progress_data)}")
-                            time.sleep(10)  # Wait before retry
-                        else:
-                            raise e
-            
-            # Send progress update
-            progress_data = {
-                "stage": "Preparing model for training",
-                "percentage": 50,
-                "message": "Preparing model for k-bit training..."
-            }
-            print(f"PROGRESS_UPDATE: {json.dumps(progress_data)}")
+                if gpu_available:
+                    # Keep automatic placement here: unquantized weights may need to spill to CPU
+                    model_kwargs = {
+                        "torch_dtype": torch.float16,
+                        "device_map": "auto",
+                        "max_memory": self._get_max_memory(),
+                        **self._get_attn_args(huggingface_model)
+                    }
+                else:
+                    model_kwargs = {"torch_dtype": torch.float32, "device_map": "cpu"}
             
-            # Prepare model for k-bit training
-            model = prepare_model_for_kbit_training(model)
+            try:
+                model = self._download_with_retries(
+                    lambda local_files_only: AutoModelForCausalLM.from_pretrained(
+                        huggingface_model,
+                        trust_remote_code=self._needs_remote_code(huggingface_model),
+                        local_files_only=local_files_only,
+                        low_cpu_mem_usage=True,  # Load shards straight into place, no full CPU copy first
+                        # The built-in architectures we map to all ship safetensors; never fall
+                        # back to unpickling .bin checkpoints for them
+                        use_safetensors=True if not self._needs_remote_code(huggingface_model) else None,
+                        **model_kwargs
+                    ),
+                    stage="Loading model", label="model", start_pct=45, end_pct=48,
+                    timeout=600, retry_delay=10, update_interval=5, description=description,
+                    local_first=self._is_in_hf_cache(huggingface_model, self._weight_files(huggingface_model))
+                )
+            except Exception:
+                # Don't wait for the tokenizer: its daemon thread is abandoned (or never
+                # starts), so its remaining retries can't hold up the exit of a failed run
+                tokenizer_future.cancel()
+                raise
+            
+            # Collect the tokenizer downloaded in parallel with the model
+            # (its retries and per-attempt timeouts are handled on the worker)
+            tokenizer = tokenizer_future.result()
+            
+            _write_progress_line(PROGRESS_KBIT_PREP)
+            
+            if "quantization_config" in model_kwargs:
+                # Prepare model for k-bit training, trading recompute for activation memory
+                model = prepare_model_for_kbit_training(
+                    model, use_gradient_checkpointing=True,
+                    gradient_checkpointing_kwargs=GRADIENT_CHECKPOINTING_KWARGS
+                )
+            else:
+                # Unquantized weights gain nothing from k-bit prep, which would also upcast
+                # them to fp32; just turn on gradient checkpointing
+                model.gradient_checkpointing_enable(gradient_checkpointing_kwargs=GRADIENT_CHECKPOINTING_KWARGS)
+                model.enable_input_require_grads()
             
-            # Send final progress update
-            progress_data = {
-                "stage": "Model preparation complete",
-                "percentage": 60,
-                "message": "Model loaded and prepared successfully for fine-tuning!"
-            }
-            print(f"PROGRESS_UPDATE: {json.dumps(progress_data)}")
+            _write_progress_line(PROGRESS_MODEL_READY)
             
             return model, tokenizer
             
@@ -787,7 +1139,10 @@ class FineTuningManager:
             self.logger.error(f"Error preparing model: {e}")
             error_str = str(e).lower()
             
-            if "gated repo" in error_str:
+            if isinstance(e, InsufficientResourcesError):
+                # Already a specific, user-facing message
+                raise
+            elif "gated repo" in error_str:
                 raise Exception(
                     f"Model '{model_name}' requires Hugging Face authentication.\n"
                     f"For testing, try using a public model like 'phi3:mini'.\n"
@@ -835,26 +1190,131 @@ class FineTuningManager:
 
     def _check_ollama_model_exists(self, model_name: str) -> bool:
         """Check if a model exists in Ollama"""
+        # Models don't disappear mid-session, but a missing one may be pulled
+        # at any time, so only positive results are remembered
+        if model_name in self._known_ollama_models:
+            return True
+        
         try:
-            result = subprocess.run(['ollama', 'list'], capture_output=True, text=True)
-            if result.returncode != 0:
-                return False
-            
-            # Parse the output to check if model exists
-            models = result.stdout.strip().split('\n')[1:]  # Skip header
-            return any(model_name in line for line in models)
+            exists = any(model_name in line for line in self._list_ollama_models())
+            if exists:
+                self._known_ollama_models.add(model_name)
+            return exists
         except Exception as e:
             self.logger.error(f"Error checking Ollama models: {e}")
             return False
+    
+    def _list_ollama_models(self) -> List[str]:
+        """Names of the installed Ollama models (CLI table rows when the API is unreachable)"""
+        if ollama is not None:
+            try:
+                # Ask the daemon directly (/api/tags) instead of spawning the CLI
+                return [model["model"] for model in ollama.list()["models"]]
+            except Exception as e:
+                self.logger.debug(f"Ollama API unavailable, falling back to the CLI: {e}")
+        
+        result = subprocess.run(['ollama', 'list'], capture_output=True, text=True)
+        if result.returncode != 0:
+            return []
+        
+        # Each row starts with the model name
+        return result.stdout.strip().split('\n')[1:]  # Skip header
+
+    def _is_in_hf_cache(self, repo_id: str, filenames: Tuple[str, ...]) -> bool:
+        """Check whether any of the given files is already in the local Hugging Face cache"""
+        try:
+            from huggingface_hub import try_to_load_from_cache
+        except ImportError:
+            return False
+        
+        for filename in filenames:
+            try:
+                # Returns the cached file path as a string when present
+                if isinstance(try_to_load_from_cache(repo_id, filename), str):
+                    return True
+            except Exception as e:
+                self.logger.debug(f"Hugging Face cache lookup failed for {repo_id}/{filename}: {e}")
+        return False
 
+    def _weight_files(self, huggingface_model: str) -> Tuple[str, ...]:
+        """Weight files from_pretrained can load for this model
+        
+        Built-in architectures are loaded with use_safetensors=True, so a cached
+        .bin checkpoint doesn't count for them.
+        """
+        if self._needs_remote_code(huggingface_model):
+            return HF_WEIGHT_FILES
+        return HF_SAFETENSORS_WEIGHT_FILES
+    
+    def _get_model_download_bytes(self, huggingface_model: str) -> Optional[int]:
+        """Size of the weight files from_pretrained will fetch, or None if the Hub can't tell us"""
+        try:
+            from huggingface_hub import HfApi
+            siblings = HfApi().model_info(
+                huggingface_model, files_metadata=True, timeout=HF_METADATA_TIMEOUT
+            ).siblings or []
+        except Exception as e:
+            self.logger.debug(f"Could not fetch file sizes for {huggingface_model}: {e}")
+            return None
+        
+        # transformers prefers safetensors and only falls back to .bin checkpoints
+        safetensors_bytes = sum(f.size or 0 for f in siblings if f.rfilename.endswith('.safetensors'))
+        if safetensors_bytes:
+            return safetensors_bytes
+        return sum(f.size or 0 for f in siblings if f.rfilename.endswith('.bin')) or None
+    
+    def _check_model_resources(self, huggingface_model: str) -> None:
+        """Pre-flight disk and RAM check for the model about to be downloaded and loaded"""
+        # Disk space only matters if the weights still need downloading, and RAM only
+        # without a usable GPU, where the full-precision weights go to system memory.
+        # If neither applies, don't ask the Hub for file sizes at all
+        check_disk = not self._is_in_hf_cache(huggingface_model, self._weight_files(huggingface_model))
+        gpu_available, _ = self._check_gpu()
+        check_ram = psutil is not None and not gpu_available
+        if not (check_disk or check_ram):
+            return
+        
+        required_bytes = self._get_model_download_bytes(huggingface_model)
+        if not required_bytes:
+            return
+        required_gb = required_bytes / (1024**3)
+        
+        if check_disk:
+            free_gb = self._get_free_space_gb(self._get_hf_cache_dir())
+            if free_gb < required_gb:
+                raise InsufficientResourcesError(
+                    f"Insufficient disk space to download model '{huggingface_model}'.\n"
+                    f"It needs {required_gb:.1f}GB but only {free_gb:.1f}GB is free in the Hugging Face cache "
+                    f"({self._get_hf_cache_dir()})."
+                )
+        
+        if check_ram:
+            available_gb = psutil.virtual_memory().available / (1024**3)
+            if available_gb < required_gb:
+                raise InsufficientResourcesError(
+                    f"Insufficient memory to load model '{huggingface_model}'.\n"
+                    f"It needs about {required_gb:.1f}GB of RAM but only {available_gb:.1f}GB is available. "
+                    f"Please close other applications or use a smaller model."
+                )
+    
+    def _needs_remote_code(self, huggingface_model: str) -> bool:
+        """Only allow custom model/tokenizer code for architectures transformers doesn't ship"""
+        return not huggingface_model.startswith(NATIVE_HF_MODEL_PREFIXES)
+    
     def _get_huggingface_equivalent(self, ollama_model: str) -> str:
         """Dynamically detect Hugging Face equivalent for an Ollama model"""
         
-        # Normalize model name for pattern matching
-        model_lower = ollama_model.lower().replace('-', '').replace('_', '')
+        hf_model = self._hf_equivalent_cache.get(ollama_model)
+        if hf_model is None:
+            hf_model = self._resolve_huggingface_equivalent(ollama_model)
+            self._hf_equivalent_cache[ollama_model] = hf_model
+        return hf_model
+    
+    def _resolve_huggingface_equivalent(self, ollama_model: str) -> str:
+        """Resolve the Hugging Face equivalent without consulting the cache"""
         
         # Dynamic pattern matching for different model families
-        hf_model = self._detect_model_family(model_lower, ollama_model)
+        hf_model = self._detect_model_family(ollama_model.lower())
         
         if hf_model:
             return hf_model
@@ -868,125 +1328,25 @@ class FineTuningManager:
         # Fallback: provide helpful error with detected patterns
         return self._generate_helpful_error(ollama_model)
     
-    def _detect_model_family(self, model_lower: str, original_model: str) -> str:
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def _detect_model_family(model_lower: str) -> Optional[str]:
         """Dynamically detect model family and return HF equivalent"""
         
-        # Llama 3 family detection
-        if 'llama3' in model_lower or 'llama3.2' in model_lower:
-            return self._detect_llama3_variant(model_lower, original_model)
-        
-        # Llama 2 family detection
-        elif 'llama2' in model_lower or 'llama2' in model_lower:
-            return self._detect_llama2_variant(model_lower, original_model)
-        
-        # Phi family detection
-        elif 'phi3' in model_lower or 'phi' in model_lower:
-            return self._detect_phi_variant(model_lower, original_model)
-        
-        # Mistral family detection
-        elif 'mistral' in model_lower:
-            return self._detect_mistral_variant(model_lower, original_model)
-        
-        # CodeLlama family detection
-        elif 'codellama' in model_lower or 'code' in model_lower:
-            return self._detect_codellama_variant(model_lower, original_model)
-        
-        # Gemma family detection
-        elif 'gemma' in model_lower:
-            return self._detect_gemma_variant(model_lower, original_model)
-        
-        # Qwen family detection
-        elif 'qwen' in model_lower:
-            return self._detect_qwen_variant(model_lower, original_model)
-        
-        return None
-    
-    def _detect_llama3_variant(self, model_lower: str, original_model: str) -> str:
-        """Detect Llama 3 variant and return appropriate HF model"""
-        
-        # Extract size information
-        if '3b' in model_lower or '3b' in original_model:
-            return "meta-llama/Llama-3.2-3B-Instruct"
-        elif '8b' in model_lower or '8b' in original_model:
-            return "meta-llama/Llama-3.2-8B-Instruct"
-        elif '70b' in model_lower or '70b' in original_model:
-            return "meta-llama/Llama-3.2-70B-Instruct"
-        else:
-            # Default to 3B for Llama 3
-            return "meta-llama/Llama-3.2-3B-Instruct"
-    
-    def _detect_llama2_variant(self, model_lower: str, original_model: str) -> str:
-        """Detect Llama 2 variant and return appropriate HF model"""
-        
-        # Extract size information
-        if '7b' in model_lower or '7b' in original_model:
-            return "meta-llama/Llama-2-7b-chat-hf"
-        elif '13b' in model_lower or '13b' in original_model:
-            return "meta-llama/Llama-2-13b-chat-hf"
-        elif '70b' in model_lower or '70b' in original_model:
-            return "meta-llama/Llama-2-70b-chat-hf"
-        else:
-            # Default to 7B for Llama 2
-            return "meta-llama/Llama-2-7b-chat-hf"
-    
-    def _detect_phi_variant(self, model_lower: str, original_model: str) -> str:
-        """Detect Phi variant and return appropriate HF model"""
-        
-        if 'mini' in model_lower:
-            return "microsoft/Phi-3-mini-4k-instruct"
-        elif 'small' in model_lower:
-            return "microsoft/Phi-3-small-8k-instruct"
-        elif 'medium' in model_lower:
-            return "microsoft/Phi-3-medium-4k-instruct"
-        else:
-            # Default to mini for Phi
-            return "microsoft/Phi-3-mini-4k-instruct"
-    
-    def _detect_mistral_variant(self, model_lower: str, original_model: str) -> str:
-        """Detect Mistral variant and return appropriate HF model"""
-        
-        if '7b' in model_lower or '7b' in original_model:
-            return "mistralai/Mistral-7B-Instruct-v0.2"
-        else:
-            # Default to 7B for Mistral
-            return "mistralai/Mistral-7B-Instruct-v0.2"
-    
-    def _detect_codellama_variant(self, model_lower: str, original_model: str) -> str:
-        """Detect CodeLlama variant and return appropriate HF model"""
-        
-        if '7b' in model_lower or '7b' in original_model:
-            return "codellama/CodeLlama-7b-Instruct-hf"
-        elif '13b' in model_lower or '13b' in original_model:
-            return "codellama/CodeLlama-13b-Instruct-hf"
-        elif '34b' in model_lower or '34b' in original_model:
-            return "codellama/CodeLlama-34b-Instruct-hf"
-        else:
-            # Default to 7B for CodeLlama
-            return "codellama/CodeLlama-7b-Instruct-hf"
-    
-    def _detect_gemma_variant(self, model_lower: str, original_model: str) -> str:
-        """Detect Gemma variant and return appropriate HF model"""
-        
-        if '2b' in model_lower or '2b' in original_model:
-            return "google/gemma-2b-it"
-        elif '7b' in model_lower or '7b' in original_model:
-            return "google/gemma-7b-it"
-        else:
-            # Default to 2B for Gemma
-            return "google/gemma-2b-it"
-    
-    def _detect_qwen_variant(self, model_lower: str, original_model: str) -> str:
-        """Detect Qwen variant and return appropriate HF model"""
+        # Several families can match (e.g. "codellama3"); the earliest in the priority order wins
+        families = _MODEL_FAMILY_RE.findall(model_lower.replace('-', '').replace('_', ''))
+        if not families:
+            return None
+        family = min(families, key=_MODEL_FAMILY_PRIORITY.index)
+        family = _MODEL_FAMILY_ALIASES.get(family, family)
         
-        if '7b' in model_lower or '7b' in original_model:
-            return "Qwen/Qwen2-7B-Instruct"
-        elif '14b' in model_lower or '14b' in original_model:
-            return "Qwen/Qwen2-14B-Instruct"
-        elif '72b' in model_lower or '72b' in original_model:
-            return "Qwen/Qwen2-72B-Instruct"
-        else:
-            # Default to 7B for Qwen
-            return "Qwen/Qwen2-7B-Instruct"
+        # Size ("7b") or variant ("mini") tag, falling back to the family default
+        variants = _MODEL_SIZE_RE.findall(model_lower) + _MODEL_VARIANT_RE.findall(model_lower)
+        for variant in variants:
+            hf_model = _HF_TABLE.get((family, variant))
+            if hf_model:
+                return hf_model
+        return _HF_TABLE[(family, None)]
     
     def _get_model_from_ollama_info(self, ollama_model: str) -> str:
         """Try to get model information from Ollama API to find HF equivalent"""
@@ -1046,50 +1406,98 @@ class FineTuningManager:
         
         raise Exception(error_msg)
     
-    def _create_training_dataset(self, training_data_path: str, tokenizer) -> object:
-        """Create training dataset from prepared data"""
+    def _tokenized_cache_key(self, training_texts: List[dict], tokenizer) -> str:
+        """Hash of everything that determines the tokenized dataset"""
+        digest = hashlib.blake2b(digest_size=8)
+        for example in training_texts:
+            digest.update(example["text"].encode('utf-8'))
+            digest.update(b'\0')  # Keep example boundaries part of the hash
+        digest.update(tokenizer.name_or_path.encode('utf-8'))
+        digest.update(json.dumps(TOKENIZE_KWARGS, sort_keys=True).encode('utf-8'))
+        return digest.hexdigest()
+    
+    def _create_training_dataset(self, training_texts: List[dict], tokenizer) -> object:
+        """Create training dataset from prepared examples
+        
+        Tokenized datasets are cached under fine_tuned_models/cache, keyed by the
+        examples, the tokenizer and the sequence length, so repeated runs on the
+        same data skip tokenization. Only the TOKENIZED_CACHE_MAX_ENTRIES most
+        recently used datasets are kept.
+        """
         try:
-            with open(training_data_path, 'r', encoding='utf-8') as f:
-                training_data = json.load(f)
-            
-            # Format data for instruction-following training
-            formatted_data = []
-            for item in training_data:
-                text = item.get("text", "")
-                if text:
-                    formatted_data.append({"text": text})
-            
-            # Create dataset
-            dataset = Dataset.from_list(formatted_data)
+            cache_path = self.tokenized_cache_dir / f"tokenized-{self._tokenized_cache_key(training_texts, tokenizer)}"
+            if cache_path.exists():
+                self.logger.info(f"Using cached tokenized dataset {cache_path}")
+                os.utime(cache_path)  # Mark as recently used for pruning
+                return Dataset.load_from_disk(str(cache_path))
+            
+            # Build the Arrow table straight from the examples already in memory,
+            # no JSON write and re-parse in between
+            dataset = Dataset.from_list([
+                {"text": example["text"]} for example in training_texts if example.get("text")
+            ])
             
             # Tokenize dataset
             def tokenize_function(examples):
-                return tokenizer(
-                    examples["text"],
-                    truncation=True,
-                    padding=True,
-                    max_length=512,
-                    return_tensors="pt"
-                )
+                # Python lists store columnar in Arrow; torch tensors here would only be
+                # converted back on the way out of map(). Padding is left to the collator
+                # so each batch is only padded as far as its longest example
+                return tokenizer(examples["text"], **TOKENIZE_KWARGS)
             
             tokenized_dataset = dataset.map(
                 tokenize_function,
                 batched=True,
+                batch_size=1000,
+                num_proc=TOKENIZE_NUM_PROC,  # Tokenize across several CPU cores
                 remove_columns=dataset.column_names
             )
             
+            # Save under a temporary name first so an interrupted save is never reused
+            partial_path = cache_path.with_name(cache_path.name + ".partial")
+            shutil.rmtree(partial_path, ignore_errors=True)
+            tokenized_dataset.save_to_disk(str(partial_path))
+            os.replace(partial_path, cache_path)
+            self._prune_tokenized_cache()
+            
             return tokenized_dataset
             
         except Exception as e:
             self.logger.error(f"Error creating training dataset: {e}")
             raise
     
+    def _prune_tokenized_cache(self) -> None:
+        """Delete all but the most recently used tokenized datasets
+        
+        Leftover .partial directories from interrupted saves are removed too.
+        """
+        try:
+            entries = sorted(
+                self.tokenized_cache_dir.glob("tokenized-*"),
+                key=lambda path: path.stat().st_mtime,
+                reverse=True
+            )
+        except OSError as e:
+            self.logger.warning(f"Could not list tokenized dataset cache: {e}")
+            return
+        
+        complete = [path for path in entries if not path.name.endswith(".partial")]
+        stale = complete[TOKENIZED_CACHE_MAX_ENTRIES:] + [path for path in entries if path.name.endswith(".partial")]
+        for path in stale:
+            self.logger.info(f"Removing cached tokenized dataset {path}")
+            shutil.rmtree(path, ignore_errors=True)
+    
     def start_fine_tuning(self, base_model: str, model_name: str, 
                          learning_rate: float = 0.0003, epochs: int = 3, 
-                         batch_size: int = 2, files: List[dict] = None) -> Dict:
-        """Start the fine-tuning process with LoRA"""
+                         batch_size: int = 2, files: List[dict] = None,
+                         eval_ratio: float = 0.0, save_intermediate: bool = False) -> Dict:
+        """Start the fine-tuning process with LoRA
+        
+        eval_ratio holds out that fraction of the examples for evaluation every
+        100 steps; with the default of 0 no evaluation is run. save_intermediate
+        also writes the prepared examples to training_data.json for inspection.
+        """
         
-        if not FINE_TUNING_AVAILABLE:
+        if not _check_ft_deps():
             return {
                 "success": False,
                 "error": "Fine-tuning dependencies not available. Please install: torch, transformers, peft, accelerate, datasets, trl, bitsandbytes"
@@ -1103,16 +1511,13 @@ class FineTuningManager:
             if not requirements.get("can_fine_tune", False):
                 return {
                     "success": False,
-                    "error": f"System requirements not met. RAM: {requirements.get('ram_gb', 0):.1f}GB, Storage: {requirements.get('storage_gb', 0):.1f}GB"
+                    "error": f"System requirements not met. RAM: {requirements.get('ram_gb', 0):.1f}GB, Storage: {requirements.get('storage_gb', 0):.1f}GB, Model cache storage: {requirements.get('hf_cache_storage_gb', 0):.1f}GB"
                 }
             
             # Pre-flight check: Verify model availability
-            progress_data = {
-                "stage": "Pre-flight check",
-                "percentage": 5,
-                "message": f"Verifying model '{base_model}' availability..."
-            }
-            print(f"PROGRESS_UPDATE: {json.dumps(progress_data)}")
+            with self._progress_lock:
+                self._progress_pct = 0
+            self._emit_progress("Pre-flight check", 5, f"Verifying model '{base_model}' availability...")
             
             # Check if base model exists in Ollama
             if not self._check_ollama_model_exists(base_model):
@@ -1124,47 +1529,64 @@ class FineTuningManager:
             # Check if Hugging Face equivalent is available
             try:
                 huggingface_model = self._get_huggingface_equivalent(base_model)
-                progress_data = {
-                    "stage": "Pre-flight check",
-                    "percentage": 8,
-                    "message": f"Found Hugging Face equivalent: {huggingface_model}"
-                }
-                print(f"PROGRESS_UPDATE: {json.dumps(progress_data)}")
+                self._emit_progress("Pre-flight check", 8, f"Found Hugging Face equivalent: {huggingface_model}")
             except Exception as e:
                 return {
                     "success": False,
                     "error": f"Model '{base_model}' is not supported for fine-tuning: {str(e)}"
                 }
             
+            # Prepare training data from uploaded files, before the model takes up memory
+            training_texts = self._collect_training_texts(files)
+            if save_intermediate:
+                self._save_training_data(training_texts)
+            
             # Prepare model and tokenizer
             model, tokenizer = self._prepare_model_for_training(base_model)
             
-            # Prepare training data from uploaded files
-            training_data_path = self.prepare_training_data(files)
-            
             # Create training dataset
-            dataset = self._create_training_dataset(training_data_path, tokenizer)
+            dataset = self._create_training_dataset(training_texts, tokenizer)
+            
+            if eval_ratio > 0:
+                split = dataset.train_test_split(test_size=eval_ratio, seed=42)
+                train_dataset, eval_dataset = split["train"], split["test"]
+            else:
+                train_dataset, eval_dataset = dataset, None
             
             # Setup LoRA configuration
-            lora_config = LoraConfig(**self.setup_lora_config())
+            lora_config = LoraConfig(**self.setup_lora_config(model))
             
             # Apply LoRA to model
             model = get_peft_model(model, lora_config)
             
+            compile_args = self._get_compile_args(model)
+            
             # Setup training arguments with progress tracking
             training_args = TrainingArguments(
                 output_dir=f"./fine_tuned_models/{model_name}",
                 num_train_epochs=epochs,
                 per_device_train_batch_size=batch_size,
-                gradient_accumulation_steps=4,
+                gradient_accumulation_steps=GRADIENT_ACCUMULATION_STEPS,
                 learning_rate=learning_rate,
-                fp16=True,
+                **self._get_precision_args(),
+                **compile_args,
+                gradient_checkpointing=True,
+                gradient_checkpointing_kwargs=GRADIENT_CHECKPOINTING_KWARGS,
+                # Collate batches in background workers and pin them for faster host-to-GPU copies
+                dataloader_num_workers=DATALOADER_NUM_WORKERS,
+                dataloader_persistent_workers=DATALOADER_NUM_WORKERS > 0,
+                dataloader_pin_memory=torch.cuda.is_available(),
+                # Paged 8-bit optimizer states need bitsandbytes with CUDA
+                optim="paged_adamw_8bit" if self._check_bnb_gpu_support() else "adamw_torch",
+                # Batch examples of similar length together to cut padding
+                group_by_length=True,
                 logging_steps=1,  # Log every step for real-time updates
                 save_steps=100,
-                eval_steps=100,
-                evaluation_strategy="steps",
                 save_strategy="steps",
-                load_best_model_at_end=True,
+                # Evaluating (and keeping the best checkpoint) needs a held-out split
+                eval_steps=100,
+                eval_strategy="steps" if eval_dataset is not None else "no",
+                load_best_model_at_end=eval_dataset is not None,
                 report_to=None,  # Disable wandb
                 remove_unused_columns=False,
                 push_to_hub=False,
@@ -1176,14 +1598,29 @@ class FineTuningManager:
                     self.start_time = start_time
                     self.step_count = 0
                     self.total_steps = total_steps
+                    self._inv_total_steps = 100 / max(total_steps, 1)
+                    self._last_emit = 0.0
+                
+                def on_train_begin(self, args, state, control, **kwargs):
+                    # The trainer's own count accounts for dataloader rounding
+                    if state.max_steps > 0:
+                        self.total_steps = state.max_steps
+                        self._inv_total_steps = 100 / state.max_steps
                 
                 def on_step_end(self, args, state, control, **kwargs):
                     self.step_count += 1
-                    elapsed = time.time() - self.start_time
+                    now = time.time()
+                    
+                    # At most PROGRESS_UPDATE_INTERVAL between updates, but always report the last step
+                    if now - self._last_emit < PROGRESS_UPDATE_INTERVAL and self.step_count != self.total_steps:
+                        return
+                    self._last_emit = now
+                    
+                    elapsed = now - self.start_time
                     elapsed_str = f"{int(elapsed//60)}:{int(elapsed%60):02d}"
                     
                     # Calculate progress
-                    progress = min(100, (self.step_count / self.total_steps) * 100)
+                    progress = min(100, self.step_count * self._inv_total_steps)
                     
                     # Estimate ETA
                     if self.step_count > 0:
@@ -1207,20 +1644,35 @@ class FineTuningManager:
                         "log": f"Step {self.step_count}/{self.total_steps} - Loss: {current_loss:.4f}"
                     }
                     
-                    # Print progress (will be captured by main.js)
-                    print(f"PROGRESS_UPDATE: {json.dumps(progress_data)}")
+                    # Print progress (will be captured by main.js); serialised on the
+                    # writer thread and skipped if it falls behind, the next step catches up
+                    _write_progress_line(progress_data, block=False)
             
-            # Calculate total steps
-            total_steps = len(dataset) // batch_size * epochs
+            # Calculate total steps: the callback fires once per optimizer step, i.e.
+            # once every GRADIENT_ACCUMULATION_STEPS batches
+            batches_per_epoch = math.ceil(len(train_dataset) / batch_size)
+            total_steps = math.ceil(batches_per_epoch / GRADIENT_ACCUMULATION_STEPS) * epochs
             
             # Setup trainer with progress callback
+            # Needs trl 0.10 or newer (and below 0.12, see requirements.txt): older releases
+            # reject a pre-tokenized dataset with no dataset_text_field or formatting_func,
+            # and 0.9.x raises precisely when skip_prepare_dataset is set
             trainer = SFTTrainer(
                 model=model,
-                train_dataset=dataset,
+                train_dataset=train_dataset,
+                eval_dataset=eval_dataset,
                 tokenizer=tokenizer,
                 args=training_args,
-                max_seq_length=512,
-                dataset_text_field="text",
+                max_seq_length=MAX_SEQ_LENGTH,
+                # Pad each batch dynamically, to a multiple of 8 for tensor cores. A compiled
+                # model instead gets every batch padded to the full length: fixed shapes
+                # mean one compiled graph rather than a recompile per new batch length
+                data_collator=DataCollatorForLanguageModeling(
+                    tokenizer, mlm=False,
+                    pad_to_multiple_of=MAX_SEQ_LENGTH if compile_args else 8
+                ),
+                # The dataset is already tokenized, don't let the trainer redo it
+                dataset_kwargs={"skip_prepare_dataset": True},
             )
             
             # Add progress callback
@@ -1248,8 +1700,8 @@ class FineTuningManager:
                 }
             }
             
-            with open(f"{model_save_path}/model_info.json", 'w') as f:
-                json.dump(model_info, f, indent=2)
+            # Serialise in memory and write once; json.dump issues a write per token
+            Path(model_save_path, "model_info.json").write_bytes(_json_bytes(model_info))
             
             self.logger.info(f"Fine-tuning completed successfully. Model saved to {model_save_path}")
             
@@ -1265,6 +1717,9 @@ class FineTuningManager:
                 "success": False,
                 "error": f"Fine-tuning failed: {str(e)}"
             }
+        finally:
+            # The caller prints the result next; keep it after every progress line
+            _flush_progress()
     
     def get_fine_tuned_models(self) -> List[str]:
         """Get list of available fine-tuned models"""
@@ -1287,8 +1742,9 @@ class FineTuningManager:
                 }
             
             # Check if the model has the required files
-            required_files = ["adapter_config.json", "adapter_model.bin"]
-            missing_files = [f for f in required_files if not (model_path / f).exists()]
+            missing_files = [] if (model_path / "adapter_config.json").exists() else ["adapter_config.json"]
+            if not any((model_path / f).exists() for f in ADAPTER_WEIGHT_FILES):
+                missing_files.append(" or ".join(ADAPTER_WEIGHT_FILES))
             
             if missing_files:
                 return {
@@ -1301,52 +1757,28 @@ class FineTuningManager:
             base_model = "unknown"
             if model_info_path.exists():
                 try:
-                    with open(model_info_path, 'r') as f:
-                        model_info = json.load(f)
-                        base_model = model_info.get("base_model", "unknown")
+                    model_info = json.loads(model_info_path.read_bytes())
+                    base_model = model_info.get("base_model", "unknown")
                 except Exception as e:
                     self.logger.warning(f"Could not load model info: {e}")
             
             # Create Ollama Modelfile with proper configuration
-            template_part = """{{{{ if .System }}}}{{{{ .System }}}}{{{{ end }}}
-
-{{{{ .Prompt }}}}"""
-            
-            modelfile_content = f"""# Fine-tuned model: {fine_tuned_model_name}
-# Base model: {base_model}
-# Created with ACE UI for Ollama
-
-FROM {base_model}
-
-# Load the fine-tuned adapter
-ADAPTER {fine_tuned_model_name}
-
-# System prompt template
-SYSTEM "You are a helpful AI assistant that has been fine-tuned for specific tasks."
-
-# Chat template
-TEMPLATE "{template_part}"
-
-# Parameters for better performance
-PARAMETER temperature 0.7
-PARAMETER top_p 0.9
-PARAMETER top_k 40
-PARAMETER num_ctx 4096
-PARAMETER repeat_penalty 1.1
-PARAMETER stop "### Instruction:"
-PARAMETER stop "### Response:"
-"""
+            modelfile_content = MODELFILE_TEMPLATE.substitute(
+                name=fine_tuned_model_name,
+                base_model=base_model
+            )
             
             modelfile_path = model_path / "Modelfile"
-            with open(modelfile_path, 'w') as f:
-                f.write(modelfile_content)
+            modelfile_path.write_text(modelfile_content, encoding='utf-8')
             
             self.logger.info(f"Created Modelfile for {fine_tuned_model_name}")
             
             # Create Ollama model
             self.logger.info(f"Creating Ollama model: {fine_tuned_model_name}")
             result = subprocess.run(
-                ['ollama', 'create', fine_tuned_model_name, str(modelfile_path)],
+                # The Modelfile stays on disk: ollama resolves its relative ADAPTER path
+                # against the Modelfile's directory, which a stdin pipe doesn't have
+                ['ollama', 'create', fine_tuned_model_name, '-f', str(modelfile_path)],
                 capture_output=True,
                 text=True,
                 timeout=120  # Increased timeout for model creation
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+GPU checks used by the fine-tuning manager.
+
+check_gpu() and check_gpu_type() only use NVML / nvidia-smi and are safe to
+call in-process. The bitsandbytes check imports torch, which can initialise
+CUDA and hold on to VRAM for the lifetime of the process, so the manager runs
+this file as a short-lived process for it; the driver reclaims that memory as
+soon as it exits, leaving the whole GPU to the actual training run.
+"""
+import os
+import sys
+import glob
+import json
+import subprocess
+
+def _nvml_gpu_memory_gb():
+    """Total memory of the first NVIDIA GPU via NVML, or None if NVML can't be used
+
+    NVML is the library nvidia-smi itself wraps; querying it directly avoids a
+    process spawn and, unlike torch.cuda, doesn't create a CUDA context.
+    """
+    try:
+        import pynvml
+    except ImportError:
+        return None
+
+    try:
+        pynvml.nvmlInit()
+    except Exception:
+        return None
+    try:
+        if pynvml.nvmlDeviceGetCount() == 0:
+            return 0
+        handle = pynvml.nvmlDeviceGetHandleByIndex(0)
+        return pynvml.nvmlDeviceGetMemoryInfo(handle).total / (1024 ** 3)
+    except Exception:
+        return None
+    finally:
+        pynvml.nvmlShutdown()
+
+def check_gpu():
+    """Check GPU availability using NVML, falling back to nvidia-smi"""
+    gpu_memory_gb = _nvml_gpu_memory_gb()
+    if gpu_memory_gb is not None:
+        return gpu_memory_gb > 0, gpu_memory_gb
+
+    try:
+        # Try to run nvidia-smi to check for NVIDIA GPU
+        result = subprocess.run(['nvidia-smi', '--query-gpu=memory.total', '--format=csv,noheader,nounits'],
+                              capture_output=True, text=True, timeout=5)
+
+        if result.returncode == 0:
+            # Parse GPU memory
+            gpu_memory_mb = float(result.stdout.strip())
+            gpu_memory_gb = gpu_memory_mb / 1024
+            return True, gpu_memory_gb
+        else:
+            return False, 0
+
+    except (subprocess.TimeoutExpired, FileNotFoundError, Exception):
+        return False, 0
+
+def check_gpu_type():
+    """Check what type of GPU is available"""
+    if _nvml_gpu_memory_gb():
+        return "nvidia"
+
+    try:
+        # Check for NVIDIA GPU
+        result = subprocess.run(['nvidia-smi'], capture_output=True, text=True, timeout=5)
+        if result.returncode == 0:
+            return "nvidia"
+
+        # Check for Intel or AMD GPU
+        result = subprocess.run(['lspci'], capture_output=True, text=True, timeout=5)
+        if result.returncode == 0 and 'VGA' in result.stdout:
+            if 'Intel' in result.stdout:
+                return "intel"
+            if 'AMD' in result.stdout:
+                return "amd"
+
+    except Exception:
+        pass
+
+    return "none"
+
+def check_bnb_gpu_support():
+    """Check if bitsandbytes was built with CUDA and torch can see a device"""
+    try:
+        import torch
+        import bitsandbytes as bnb
+
+        if not torch.cuda.is_available():
+            return False
+
+        # Flag exposed by bitsandbytes at import time
+        compiled_with_cuda = getattr(bnb, 'COMPILED_WITH_CUDA', None)
+        if compiled_with_cuda is not None:
+            return bool(compiled_with_cuda)
+
+        # Newer releases drop the flag; look for the CUDA native library instead
+        bnb_dir = os.path.dirname(bnb.__file__)
+        return bool(glob.glob(os.path.join(bnb_dir, 'libbitsandbytes_cuda*')))
+    except Exception as e:
+        print(f"bitsandbytes GPU support check failed: {e}", file=sys.stderr)
+        return False
+
+def probe():
+    """Collect the GPU facts that need torch"""
+    return {
+        "bnb_gpu_support": check_bnb_gpu_support()
+    }
+
+if __name__ == "__main__":
+    print(json.dumps(probe()))
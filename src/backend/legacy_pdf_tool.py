@@ -10,19 +10,40 @@ def validate_pdf_path(pdf_path):
     if not isinstance(pdf_path, str):
         raise ValueError("PDF path must be a string")
     
-    if not os.path.exists(pdf_path):
+    # One stat call answers both existence and size
+    try:
+        st = os.stat(pdf_path)
+    except OSError:
         raise ValueError("PDF file does not exist")
     
     if not pdf_path.lower().endswith('.pdf'):
         raise ValueError("File must be a PDF")
     
     # Check file size (limit to 50MB for PDFs)
-    file_size = os.path.getsize(pdf_path)
-    if file_size > 50 * 1024 * 1024:  # 50MB
+    if st.st_size > 50 * 1024 * 1024:  # 50MB
         raise ValueError("PDF file too large. Maximum size is 50MB")
     
     return pdf_path
 
+def _extract_pages(doc, page_count):
+    """Whitespace-collapsed text of the non-empty pages among the first page_count
+    
+    Pages are read one after another: PyMuPDF holds the GIL for the whole of
+    get_text, so a thread pool over pages would only take turns.
+    """
+    parts = []
+    for page_num in range(page_count):
+        try:
+            page = doc.load_page(page_num)
+            # Collapse whitespace per page rather than over the whole document
+            page_text = ' '.join(page.get_text("text").split())
+            if page_text:
+                parts.append(page_text)
+        except Exception as e:
+            logger.warning(f"Error extracting text from page {page_num}: {e}")
+            continue
+    return parts
+
 def extract_text_from_pdf(pdf_path):
     """Extract text from PDF with comprehensive error handling"""
     try:
@@ -37,26 +58,18 @@ def extract_text_from_pdf(pdf_path):
             doc.close()
             return ""
         
-        text = ""
         max_pages = 100  # Limit to prevent memory issues
+        page_count = min(doc.page_count, max_pages)
         
         # Extract text from each page
-        for page_num in range(min(doc.page_count, max_pages)):
-            try:
-                page = doc.load_page(page_num)
-                page_text = page.get_text("text")
-                if page_text:
-                    text += page_text + "\n"
-            except Exception as e:
-                logger.warning(f"Error extracting text from page {page_num}: {e}")
-                continue
+        parts = _extract_pages(doc, page_count)
         
         doc.close()
         
+        text = ' '.join(parts)
+        
         # Clean up the extracted text
         if text:
-            # Remove excessive whitespace
-            text = ' '.join(text.split())
             # Limit text length to prevent memory issues
             if len(text) > 100000:  # 100KB limit
                 text = text[:100000] + "... [text truncated]"
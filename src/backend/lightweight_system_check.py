@@ -5,12 +5,57 @@ import platform
 import subprocess
 import shutil
 import json
+import ctypes
+import functools
 
+from gpu_probe import check_gpu
+
+SYSTEM = platform.system()
+
+def _windows_ram_bytes():
+    """Total physical memory via GlobalMemoryStatusEx, or None if the call fails"""
+    class MEMORYSTATUSEX(ctypes.Structure):
+        _fields_ = [
+            ("dwLength", ctypes.c_ulong),
+            ("dwMemoryLoad", ctypes.c_ulong),
+            ("ullTotalPhys", ctypes.c_ulonglong),
+            ("ullAvailPhys", ctypes.c_ulonglong),
+            ("ullTotalPageFile", ctypes.c_ulonglong),
+            ("ullAvailPageFile", ctypes.c_ulonglong),
+            ("ullTotalVirtual", ctypes.c_ulonglong),
+            ("ullAvailVirtual", ctypes.c_ulonglong),
+            ("ullAvailExtendedVirtual", ctypes.c_ulonglong),
+        ]
+    
+    status = MEMORYSTATUSEX()
+    status.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+    if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+        return status.ullTotalPhys
+    return None
+
+def _macos_ram_bytes():
+    """hw.memsize via sysctlbyname, or None if the call fails"""
+    libc = ctypes.CDLL("/usr/lib/libc.dylib")
+    memsize = ctypes.c_uint64(0)
+    size = ctypes.c_size_t(ctypes.sizeof(memsize))
+    if libc.sysctlbyname(b"hw.memsize", ctypes.byref(memsize), ctypes.byref(size), None, 0) == 0:
+        return memsize.value
+    return None
+
+@functools.lru_cache(maxsize=1)
 def get_ram_gb():
-    """Get RAM in GB using platform-specific methods"""
+    """Get RAM in GB using platform-specific methods (installed RAM doesn't change, so cached)"""
     try:
-        if platform.system() == "Windows":
-            # Windows: use wmic command
+        if SYSTEM == "Windows":
+            # Windows: ask kernel32 directly; spawning wmic takes seconds
+            try:
+                memory_bytes = _windows_ram_bytes()
+                if memory_bytes:
+                    return memory_bytes / (1024**3)
+            except (AttributeError, OSError):
+                pass
+            
+            # Fall back to the wmic command
             result = subprocess.run(['wmic', 'computersystem', 'get', 'TotalPhysicalMemory'], 
                                   capture_output=True, text=True)
             if result.returncode == 0:
@@ -19,17 +64,31 @@ def get_ram_gb():
                     memory_kb = int(lines[1].strip()) / 1024  # Convert to MBcleacle
                     return memory_kb / 1024  # Convert to GB
                     
-        elif platform.system() == "Linux":
-            # Linux: read from /proc/meminfo
-            with open('/proc/meminfo', 'r') as f:
-                meminfo = f.read()
-                for line in meminfo.split('\n'):
-                    if 'MemTotal' in line:
+        elif SYSTEM == "Linux":
+            # Linux: total physical pages straight from libc, no file to open or parse
+            try:
+                return os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') / (1024**3)
+            except (ValueError, OSError):
+                pass
+            
+            # Fall back to reading /proc/meminfo
+            # (MemTotal is the first line; stop reading as soon as it's found)
+            with open('/proc/meminfo', 'rb') as f:
+                for line in f:
+                    if line.startswith(b'MemTotal:'):
                         memory_kb = int(line.split()[1])
                         return memory_kb / 1024 / 1024  # Convert to GB
                         
-        elif platform.system() == "Darwin":  # macOS
-            # macOS: use sysctl command
+        elif SYSTEM == "Darwin":  # macOS
+            # macOS: sysctlbyname from libc, no subprocess
+            try:
+                memory_bytes = _macos_ram_bytes()
+                if memory_bytes:
+                    return memory_bytes / (1024**3)
+            except (AttributeError, OSError):
+                pass
+            
+            # Fall back to the sysctl command
             result = subprocess.run(['sysctl', '-n', 'hw.memsize'], 
                                   capture_output=True, text=True)
             if result.returncode == 0:
@@ -42,24 +101,6 @@ def get_ram_gb():
     # Fallback: return a conservative estimate
     return 8.0
 
-def check_gpu():
-    """Check GPU availability using nvidia-smi"""
-    try:
-        # Try to run nvidia-smi to check for NVIDIA GPU
-        result = subprocess.run(['nvidia-smi', '--query-gpu=memory.total', '--format=csv,noheader,nounits'], 
-                              capture_output=True, text=True, timeout=5)
-        
-        if result.returncode == 0:
-            # Parse GPU memory
-            gpu_memory_mb = float(result.stdout.strip())
-            gpu_memory_gb = gpu_memory_mb / 1024
-            return True, gpu_memory_gb
-        else:
-            return False, 0
-            
-    except (subprocess.TimeoutExpired, FileNotFoundError, Exception) as e:
-        return False, 0
-
 def check_system_requirements():
     """Lightweight system requirements check"""
     try:
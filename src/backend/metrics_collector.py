@@ -3,23 +3,72 @@ import json
 import os
 import psutil
 import logging
-from datetime import datetime, timedelta
+import subprocess
+from datetime import datetime
 from typing import Dict, List, Optional, Any
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field
 from collections import defaultdict, deque
 import threading
+import queue
 import sys
+import atexit
 import pickle
 
+try:
+    import orjson  # Optional: much faster JSON encoding/decoding for the metrics files
+except ImportError:
+    orjson = None
+
+try:
+    import pynvml  # Optional: in-process GPU memory queries instead of running nvidia-smi
+except ImportError:
+    pynvml = None
+
 logger = logging.getLogger(__name__)
 
-# Define persistent storage file
-METRICS_STORAGE_FILE = os.path.join(os.path.dirname(__file__), 'metrics_data.pkl')
+# Define persistent storage files: every query is appended to a JSON-lines log,
+# and the running counters are snapshotted separately every so often
+METRICS_LOG_FILE = os.path.join(os.path.dirname(__file__), 'metrics_data.jsonl')
+METRICS_COUNTERS_FILE = os.path.join(os.path.dirname(__file__), 'metrics_counters.json')
+# Pickle written by earlier versions; its counters are carried over once
+LEGACY_METRICS_FILE = os.path.join(os.path.dirname(__file__), 'metrics_data.pkl')
+METRICS_SNAPSHOT_INTERVAL = 60  # seconds between counter snapshots
+METRICS_LOG_MAX_BYTES = 8 * 1024 * 1024  # compact the log back to the history once it grows past this
+DISK_USAGE_TTL = 300  # seconds between disk usage refreshes
+MONITOR_IDLE_AFTER = 300  # stop regular sampling once the dashboard hasn't been read for this long
+MONITOR_IDLE_SAMPLE_INTERVAL = 600  # but still take a baseline sample this often
+DASHBOARD_CACHE_TTL = 2.0  # seconds a computed DashboardMetrics is reused between polls
 
-@dataclass
+def _json_bytes(data) -> bytes:
+    """Serialise a dict or dataclass to compact JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    if not isinstance(data, dict):
+        data = asdict(data)
+    return json.dumps(data).encode('utf-8')
+
+def _json_loads(data: bytes):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+class _LegacyRecord:
+    """Stand-in for the metrics dataclasses pickled by earlier versions"""
+
+class _LegacyUnpickler(pickle.Unpickler):
+    """Unpickles the old metrics file without needing its (since changed) record classes"""
+    
+    def find_class(self, module, name):
+        if module in ('metrics_collector', '__main__') and name in ('QueryMetrics', 'SystemMetrics', 'DashboardMetrics'):
+            return _LegacyRecord
+        return super().find_class(module, name)
+
+# Thousands of these records sit in the history deques; without a per-instance
+# __dict__ they take roughly half the memory. dataclass(slots=...) needs 3.10+.
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+@dataclass(**_SLOTS)
 class QueryMetrics:
     """Individual query metrics"""
-    timestamp: str
+    timestamp: float  # Unix epoch seconds
     model_name: str
     input_tokens: int
     output_tokens: int
@@ -30,10 +79,10 @@ class QueryMetrics:
     success: bool
     error_message: Optional[str] = None
 
-@dataclass
+@dataclass(**_SLOTS)
 class SystemMetrics:
     """System resource metrics"""
-    timestamp: str
+    timestamp: float  # Unix epoch seconds
     cpu_percent: float
     memory_percent: float
     memory_used_gb: float
@@ -42,7 +91,7 @@ class SystemMetrics:
     gpu_available: bool
     gpu_memory_percent: Optional[float] = None
 
-@dataclass
+@dataclass(**_SLOTS)
 class DashboardMetrics:
     """Aggregated dashboard metrics"""
     total_queries: int
@@ -56,6 +105,15 @@ class DashboardMetrics:
     system_health: str
     current_model_usage: Dict[str, int]
 
+@dataclass
+class TimeBucket:
+    """Query totals for one fixed time slot of a ring buffer"""
+    start: float = -1.0
+    queries: int = 0
+    tokens: int = 0
+    latency_sum: float = 0
+    model_usage: Dict[str, int] = field(default_factory=dict)
+
 class MetricsCollector:
     """Real-time metrics collection and aggregation for MLOps dashboard"""
     
@@ -71,14 +129,47 @@ class MetricsCollector:
         self.total_tokens_used = 0
         self.model_usage = defaultdict(int)
         
+        # Pre-aggregated time windows, so the dashboard never has to scan the history:
+        # one bucket per minute for the last hour, one per hour for the chart range
+        self._minute_buckets = [TimeBucket() for _ in range(60)]
+        self._hour_buckets = [TimeBucket() for _ in range(max_history_hours)]
+        self._history_latency_sum = 0.0
+        
+        # record_query only enqueues; counters, history and the log are updated under
+        # self.lock by whoever drains the queue (the monitor thread, or a reader)
+        self._ingest_q = queue.SimpleQueue()
+        
+        # Last get_dashboard_metrics result; reset whenever the underlying data changes
+        self._dash_cache = None
+        self._dash_cache_ts = 0.0
+        
+        # System facts that don't need re-reading on every tick
+        self._nvml_handle = self._init_nvml()
+        self._nvidia_smi_works = None  # Unknown until the first nvidia-smi attempt
+        self._memory_total_gb = psutil.virtual_memory().total / (1024**3)
+        self._disk_usage_percent = 0.0
+        self._disk_usage_checked = None
+        
         # Threading for background system monitoring
+        self._last_dashboard_access = time.monotonic()
+        self._last_system_sample = None
         self.monitoring_active = False
         self.monitor_thread = None
-        self.lock = threading.Lock()
+        self.lock = threading.RLock()
+        
+        # The counters snapshot is written by the monitor thread, and only when a
+        # query (or a migration in load_metrics) marked it dirty
+        self._dirty = threading.Event()
         
         # Load existing metrics data
         self.load_metrics()
         
+        # Queries are appended to the log as they come in
+        self._query_log = open(METRICS_LOG_FILE, 'ab', buffering=64 * 1024)
+        self._last_snapshot = time.monotonic()
+        # Most processes record a single query and exit well before the next snapshot
+        atexit.register(self._save_if_dirty)
+        
         # Start background system monitoring
         self.start_system_monitoring()
         
@@ -86,27 +177,29 @@ class MetricsCollector:
         try:
             initial_metrics = self.get_system_metrics()
             self.system_history.append(initial_metrics)
-            logger.info(f"Initial system metrics collected: CPU={initial_metrics.cpu_percent}%, Memory={initial_metrics.memory_percent}%")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Initial system metrics collected: CPU={initial_metrics.cpu_percent}%, Memory={initial_metrics.memory_percent}%")
         except Exception as e:
             logger.error(f"Error collecting initial system metrics: {e}")
     
     def record_query(self, query_data: Dict[str, Any]) -> None:
         """Record a query with its metrics"""
         try:
-            # Extract query information
-            model_name = query_data.get('model_name', 'unknown')
+            # Extract query information (the few distinct model names and query types
+            # are interned so the history shares one string object per value)
+            model_name = sys.intern(str(query_data.get('model_name', 'unknown')))
             input_tokens = query_data.get('input_tokens', 0)
             output_tokens = query_data.get('output_tokens', 0)
             total_tokens = query_data.get('total_tokens', 0)
             latency_ms = query_data.get('latency_ms', 0)
-            query_type = query_data.get('query_type', 'text')
+            query_type = sys.intern(str(query_data.get('query_type', 'text')))
             file_processed = query_data.get('file_processed', False)
             success = query_data.get('success', True)
             error_message = query_data.get('error_message', None)
             
             # Create query metrics
             query_metrics = QueryMetrics(
-                timestamp=datetime.now().isoformat(),
+                timestamp=time.time(),
                 model_name=model_name,
                 input_tokens=input_tokens,
                 output_tokens=output_tokens,
@@ -118,32 +211,99 @@ class MetricsCollector:
                 error_message=error_message
             )
             
-            # Update metrics without lock for basic operations
-            self.total_queries += 1
-            if success:
-                self.successful_queries += 1
-            else:
-                self.failed_queries += 1
-            
-            self.total_tokens_used += total_tokens
-            self.model_usage[model_name] += 1
-            
-            # Add to history
-            self.query_history.append(query_metrics)
-            
-            # Log the recording
-            logger.info(f"Recorded query: {model_name}, {total_tokens} tokens, {latency_ms}ms")
-            logger.info(f"Total queries: {self.total_queries}, Total tokens: {self.total_tokens_used}")
-            
-            # Save metrics data to persistent storage
-            try:
-                self.save_metrics()
-            except Exception as e:
-                logger.error(f"Error saving metrics: {e}")
+            self._ingest_q.put_nowait(query_metrics)
+            self._dirty.set()
+            self._dash_cache = None
                 
         except Exception as e:
             logger.error(f"Error recording query metrics: {e}")
     
+    def _drain_ingest_queue(self) -> None:
+        """Apply every queued query to the counters, history and persistent log"""
+        with self.lock:
+            while True:
+                try:
+                    query_metrics = self._ingest_q.get_nowait()
+                except queue.Empty:
+                    return
+                
+                self._apply_query(query_metrics)
+                
+                # Log the recording (per query only at debug level; running totals now and then)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"Recorded query: {query_metrics.model_name}, {query_metrics.total_tokens} tokens, {query_metrics.latency_ms}ms")
+                if self.total_queries % 100 == 0:
+                    logger.info(f"Total queries: {self.total_queries}, Total tokens: {self.total_tokens_used}")
+                
+                # Append to the persistent query log (O(1) per query, flushed in the background)
+                try:
+                    self._query_log.write(_json_bytes(query_metrics) + b'\n')
+                except Exception as e:
+                    logger.error(f"Error saving metrics: {e}")
+    
+    def _apply_query(self, query_metrics: QueryMetrics) -> None:
+        """Fold a query into the running counters and history"""
+        # Callers hold self.lock (or are still in __init__)
+        self.total_queries += 1
+        if query_metrics.success:
+            self.successful_queries += 1
+        else:
+            self.failed_queries += 1
+        
+        self.total_tokens_used += query_metrics.total_tokens
+        self.model_usage[query_metrics.model_name] += 1
+        
+        self._add_to_history(query_metrics)
+    
+    def _add_to_history(self, query_metrics: QueryMetrics) -> None:
+        """Append a query to the history and its time buckets"""
+        if len(self.query_history) == self.query_history.maxlen:
+            self._history_latency_sum -= self.query_history[0].latency_ms
+        self.query_history.append(query_metrics)
+        self._history_latency_sum += query_metrics.latency_ms
+        
+        ts = query_metrics.timestamp
+        for bucket in (self._get_bucket(self._minute_buckets, self._minute_start(ts), 60),
+                       self._get_bucket(self._hour_buckets, self._hour_start(ts), 3600)):
+            if bucket is None:
+                continue
+            bucket.queries += 1
+            bucket.tokens += query_metrics.total_tokens
+            bucket.latency_sum += query_metrics.latency_ms
+            bucket.model_usage[query_metrics.model_name] = bucket.model_usage.get(query_metrics.model_name, 0) + 1
+    
+    @staticmethod
+    def _minute_start(ts: float) -> float:
+        return ts - ts % 60
+    
+    @staticmethod
+    def _hour_start(ts: float) -> float:
+        """Start of the local-time hour containing ts (matches the chart's hour labels)"""
+        return ts - (ts + time.localtime(ts).tm_gmtoff) % 3600
+    
+    @staticmethod
+    def _get_bucket(buckets: List[TimeBucket], start: float, width: int) -> Optional[TimeBucket]:
+        """Bucket for the slot beginning at start, recycling the ring slot if it's stale"""
+        index = int(start // width) % len(buckets)
+        bucket = buckets[index]
+        if bucket.start == start:
+            return bucket
+        if bucket.start > start:
+            # Older than anything the ring still covers
+            return None
+        bucket = buckets[index] = TimeBucket(start=start)
+        return bucket
+    
+    @staticmethod
+    def _live_buckets(buckets: List[TimeBucket], newest_start: float, width: int, count: int) -> List[TimeBucket]:
+        """The buckets for the count slots ending at newest_start, newest first (empty if unused)"""
+        live = []
+        for i in range(count):
+            start = newest_start - i * width
+            bucket = buckets[int(start // width) % len(buckets)]
+            live.append(bucket if bucket.start == start else TimeBucket(start=start))
+        return live
+    
     def get_system_metrics(self) -> SystemMetrics:
         """Get current system resource metrics"""
         try:
@@ -152,33 +312,16 @@ class MetricsCollector:
             memory = psutil.virtual_memory()
             memory_percent = memory.percent
             memory_used_gb = memory.used / (1024**3)
-            memory_total_gb = memory.total / (1024**3)
+            memory_total_gb = self._memory_total_gb
             
             # Disk usage
-            disk = psutil.disk_usage('/')
-            disk_usage_percent = (disk.used / disk.total) * 100
+            disk_usage_percent = self._get_disk_usage_percent()
             
-            # GPU detection (basic) - with shorter timeout
-            gpu_available = False
-            gpu_memory_percent = None
-            
-            try:
-                # Try to get GPU info using nvidia-smi with shorter timeout
-                import subprocess
-                result = subprocess.run(['nvidia-smi', '--query-gpu=memory.used,memory.total', '--format=csv,noheader,nounits'], 
-                                      capture_output=True, text=True, timeout=1)  # Reduced from 5s to 1s
-                if result.returncode == 0:
-                    gpu_available = True
-                    # Parse GPU memory usage
-                    lines = result.stdout.strip().split('\n')
-                    if lines and lines[0]:
-                        used, total = map(int, lines[0].split(', '))
-                        gpu_memory_percent = (used / total) * 100 if total > 0 else 0
-            except Exception:
-                gpu_available = False
+            # GPU memory
+            gpu_available, gpu_memory_percent = self._get_gpu_memory()
             
             return SystemMetrics(
-                timestamp=datetime.now().isoformat(),
+                timestamp=time.time(),
                 cpu_percent=cpu_percent,
                 memory_percent=memory_percent,
                 memory_used_gb=memory_used_gb,
@@ -191,7 +334,7 @@ class MetricsCollector:
         except Exception as e:
             logger.error(f"Error getting system metrics: {e}")
             return SystemMetrics(
-                timestamp=datetime.now().isoformat(),
+                timestamp=time.time(),
                 cpu_percent=0,
                 memory_percent=0,
                 memory_used_gb=0,
@@ -201,6 +344,59 @@ class MetricsCollector:
                 gpu_memory_percent=None
             )
     
+    def _init_nvml(self):
+        """Handle for the first NVIDIA GPU via NVML, or None if NVML can't be used"""
+        if pynvml is None:
+            return None
+        try:
+            pynvml.nvmlInit()
+            if pynvml.nvmlDeviceGetCount() == 0:
+                return None
+            return pynvml.nvmlDeviceGetHandleByIndex(0)
+        except Exception:
+            return None
+    
+    def _get_disk_usage_percent(self) -> float:
+        """Disk usage, refreshed at most every DISK_USAGE_TTL seconds"""
+        now = time.monotonic()
+        if self._disk_usage_checked is None or now - self._disk_usage_checked >= DISK_USAGE_TTL:
+            disk = psutil.disk_usage('/')
+            self._disk_usage_percent = (disk.used / disk.total) * 100
+            self._disk_usage_checked = now
+        return self._disk_usage_percent
+    
+    def _get_gpu_memory(self):
+        """(gpu_available, gpu_memory_percent), preferring NVML over spawning nvidia-smi"""
+        if self._nvml_handle is not None:
+            try:
+                memory = pynvml.nvmlDeviceGetMemoryInfo(self._nvml_handle)
+                return True, (memory.used / memory.total) * 100 if memory.total > 0 else 0
+            except Exception:
+                pass
+        
+        # If the first nvidia-smi attempt failed there is no NVIDIA GPU to find; don't
+        # spawn a process every tick for the rest of the session
+        if self._nvidia_smi_works is False:
+            return False, None
+        
+        try:
+            # Try to get GPU info using nvidia-smi with shorter timeout
+            result = subprocess.run(['nvidia-smi', '--query-gpu=memory.used,memory.total', '--format=csv,noheader,nounits'], 
+                                  capture_output=True, text=True, timeout=1)  # Reduced from 5s to 1s
+            if result.returncode == 0:
+                self._nvidia_smi_works = True
+                # Parse GPU memory usage
+                lines = result.stdout.strip().split('\n')
+                if lines and lines[0]:
+                    used, total = map(int, lines[0].split(', '))
+                    return True, (used / total) * 100 if total > 0 else 0
+                return True, None
+        except Exception:
+            pass
+        if self._nvidia_smi_works is None:
+            self._nvidia_smi_works = False
+        return False, None
+    
     def start_system_monitoring(self) -> None:
         """Start background system monitoring"""
         if self.monitoring_active:
@@ -214,12 +410,25 @@ class MetricsCollector:
         """Background loop for system monitoring"""
         while self.monitoring_active:
             try:
-                system_metrics = self.get_system_metrics()
-                # Add to history without lock to prevent deadlocks
-                self.system_history.append(system_metrics)
+                # While nobody reads the dashboard, only keep an occasional baseline sample
+                now = time.monotonic()
+                idle = now - self._last_dashboard_access > MONITOR_IDLE_AFTER
+                if (not idle or self._last_system_sample is None
+                        or now - self._last_system_sample >= MONITOR_IDLE_SAMPLE_INTERVAL):
+                    system_metrics = self.get_system_metrics()
+                    # Add to history without lock to prevent deadlocks
+                    self.system_history.append(system_metrics)
+                    self._last_system_sample = now
+                    
+                    # Debug logging
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug(f"System metrics collected: CPU={system_metrics.cpu_percent}%, Memory={system_metrics.memory_percent}%")
+                
+                self._drain_ingest_queue()
                 
-                # Debug logging
-                logger.info(f"System metrics collected: CPU={system_metrics.cpu_percent}%, Memory={system_metrics.memory_percent}%")
+                # Periodically persist the log and counters if queries came in
+                if time.monotonic() - self._last_snapshot >= METRICS_SNAPSHOT_INTERVAL:
+                    self._save_if_dirty()
                 
                 # Sleep for 30 seconds to be more responsive
                 time.sleep(30)
@@ -230,52 +439,50 @@ class MetricsCollector:
     
     def get_dashboard_metrics(self) -> DashboardMetrics:
         """Get aggregated metrics for dashboard display"""
+        now_monotonic = self._last_dashboard_access = time.monotonic()
+        if self._dash_cache is not None and now_monotonic - self._dash_cache_ts < DASHBOARD_CACHE_TTL:
+            return self._dash_cache
         try:
-            # Calculate time ranges
-            now = datetime.now()
-            one_hour_ago = now - timedelta(hours=1)
-            one_day_ago = now - timedelta(hours=24)
-            
-            # Filter queries by time
-            recent_queries = [
-                q for q in self.query_history 
-                if datetime.fromisoformat(q.timestamp) >= one_hour_ago
-            ]
-            
-            day_queries = [
-                q for q in self.query_history 
-                if datetime.fromisoformat(q.timestamp) >= one_day_ago
-            ]
-            
-            # Calculate averages
-            if self.query_history:
-                avg_latency = sum(q.latency_ms for q in self.query_history) / len(self.query_history)
-            else:
-                avg_latency = 0
-            
-            # Get active models (used in last 24 hours)
-            active_models = list(set(q.model_name for q in day_queries))
-            
-            # Determine system health
-            system_health = self._determine_system_health()
-            
-            # Get current model usage (last hour)
-            current_model_usage = defaultdict(int)
-            for query in recent_queries:
-                current_model_usage[query.model_name] += 1
-            
-            return DashboardMetrics(
-                total_queries=self.total_queries,
-                successful_queries=self.successful_queries,
-                failed_queries=self.failed_queries,
-                avg_latency_ms=avg_latency,
-                total_tokens_used=self.total_tokens_used,
-                active_models=active_models,
-                queries_last_hour=len(recent_queries),
-                queries_last_24h=len(day_queries),
-                system_health=system_health,
-                current_model_usage=dict(current_model_usage)
-            )
+            with self.lock:
+                self._drain_ingest_queue()
+                
+                # Time windows come straight from the pre-aggregated buckets
+                now = time.time()
+                recent_buckets = self._live_buckets(self._minute_buckets, self._minute_start(now), 60, 60)
+                day_buckets = self._live_buckets(self._hour_buckets, self._hour_start(now), 3600, len(self._hour_buckets))
+                
+                # Calculate averages
+                if self.query_history:
+                    avg_latency = self._history_latency_sum / len(self.query_history)
+                else:
+                    avg_latency = 0
+                
+                # Get active models (used in last 24 hours)
+                active_models = list(set(model for b in day_buckets for model in b.model_usage))
+                
+                # Determine system health
+                system_health = self._determine_system_health()
+                
+                # Get current model usage (last hour)
+                current_model_usage = defaultdict(int)
+                for bucket in recent_buckets:
+                    for model, count in bucket.model_usage.items():
+                        current_model_usage[model] += count
+                
+                self._dash_cache = DashboardMetrics(
+                    total_queries=self.total_queries,
+                    successful_queries=self.successful_queries,
+                    failed_queries=self.failed_queries,
+                    avg_latency_ms=avg_latency,
+                    total_tokens_used=self.total_tokens_used,
+                    active_models=active_models,
+                    queries_last_hour=sum(b.queries for b in recent_buckets),
+                    queries_last_24h=sum(b.queries for b in day_buckets),
+                    system_health=system_health,
+                    current_model_usage=dict(current_model_usage)
+                )
+                self._dash_cache_ts = now_monotonic
+            return self._dash_cache
             
         except Exception as e:
             logger.error(f"Error getting dashboard metrics: {e}")
@@ -327,54 +534,26 @@ class MetricsCollector:
     def get_time_series_data(self, hours: int = 24) -> Dict[str, List]:
         """Get time series data for charts"""
         try:
-            cutoff_time = datetime.now() - timedelta(hours=hours)
-            
-            # Filter queries by time
-            recent_queries = [
-                q for q in self.query_history 
-                if datetime.fromisoformat(q.timestamp) >= cutoff_time
-            ]
-            
-            # Create hourly buckets for the last 24 hours
-            hourly_data = {}
-            current_time = datetime.now()
-            
-            # Initialize all hours in the range with zero data
-            for i in range(hours):
-                hour_time = current_time - timedelta(hours=i)
-                hour_key = hour_time.replace(minute=0, second=0, microsecond=0)
-                hourly_data[hour_key] = {
-                    'queries': 0,
-                    'tokens': 0,
-                    'latency_sum': 0,
-                    'count': 0
-                }
-            
-            # Add actual query data to the appropriate hours
-            for query in recent_queries:
-                query_time = datetime.fromisoformat(query.timestamp)
-                hour_key = query_time.replace(minute=0, second=0, microsecond=0)
+            with self.lock:
+                self._drain_ingest_queue()
                 
-                if hour_key in hourly_data:
-                    hourly_data[hour_key]['queries'] += 1
-                    hourly_data[hour_key]['tokens'] += query.total_tokens
-                    hourly_data[hour_key]['latency_sum'] += query.latency_ms
-                    hourly_data[hour_key]['count'] += 1
-            
-            # Convert to lists for charting (in chronological order)
-            timestamps = []
-            queries_per_hour = []
-            tokens_per_hour = []
-            avg_latency_per_hour = []
-            
-            for hour in sorted(hourly_data.keys()):
-                data = hourly_data[hour]
-                timestamps.append(hour.isoformat())
-                queries_per_hour.append(data['queries'])
-                tokens_per_hour.append(data['tokens'])
-                avg_latency_per_hour.append(
-                    data['latency_sum'] / data['count'] if data['count'] > 0 else 0
-                )
+                # One pre-aggregated bucket per hour, covering up to max_history_hours
+                hours = min(hours, len(self._hour_buckets))
+                buckets = self._live_buckets(self._hour_buckets, self._hour_start(time.time()), 3600, hours)
+                
+                # Convert to lists for charting (in chronological order)
+                timestamps = []
+                queries_per_hour = []
+                tokens_per_hour = []
+                avg_latency_per_hour = []
+                
+                for bucket in reversed(buckets):
+                    timestamps.append(datetime.fromtimestamp(bucket.start).isoformat())
+                    queries_per_hour.append(bucket.queries)
+                    tokens_per_hour.append(bucket.tokens)
+                    avg_latency_per_hour.append(
+                        bucket.latency_sum / bucket.queries if bucket.queries > 0 else 0
+                    )
             
             return {
                 'timestamps': timestamps,
@@ -394,6 +573,7 @@ class MetricsCollector:
     
     def get_latest_system_metrics(self) -> Optional[SystemMetrics]:
         """Get the most recent system metrics"""
+        self._last_dashboard_access = time.monotonic()
         try:
             if self.system_history:
                 return self.system_history[-1]
@@ -406,21 +586,21 @@ class MetricsCollector:
         """Clean up old metrics data"""
         try:
             with self.lock:
-                cutoff_time = datetime.now() - timedelta(hours=self.max_history_hours)
+                self._drain_ingest_queue()
+                cutoff_time = time.time() - self.max_history_hours * 3600
+                
+                # Both histories are appended in time order, so everything expired
+                # is at the front
                 
                 # Clean up query history
-                self.query_history = deque(
-                    [q for q in self.query_history 
-                     if datetime.fromisoformat(q.timestamp) >= cutoff_time],
-                    maxlen=10000
-                )
+                while self.query_history and self.query_history[0].timestamp < cutoff_time:
+                    self._history_latency_sum -= self.query_history.popleft().latency_ms
                 
                 # Clean up system history
-                self.system_history = deque(
-                    [s for s in self.system_history 
-                     if datetime.fromisoformat(s.timestamp) >= cutoff_time],
-                    maxlen=1440
-                )
+                while self.system_history and self.system_history[0].timestamp < cutoff_time:
+                    self.system_history.popleft()
+                
+                self._dash_cache = None
                 
                 logger.info("Cleaned up old metrics data")
                 
@@ -431,10 +611,11 @@ class MetricsCollector:
         """Export metrics data"""
         try:
             with self.lock:
+                self._drain_ingest_queue()
                 data = {
                     'dashboard_metrics': asdict(self.get_dashboard_metrics()),
-                    'query_history': [asdict(q) for q in list(self.query_history)[-1000:]],  # Last 1000 queries
-                    'system_history': [asdict(s) for s in list(self.system_history)[-1440:]],  # Last 24 hours
+                    'query_history': [self._export_record(q) for q in list(self.query_history)[-1000:]],  # Last 1000 queries
+                    'system_history': [self._export_record(s) for s in list(self.system_history)[-1440:]],  # Last 24 hours
                     'export_timestamp': datetime.now().isoformat()
                 }
                 
@@ -447,49 +628,132 @@ class MetricsCollector:
             logger.error(f"Error exporting metrics: {e}")
             return "{}"
 
+    @staticmethod
+    def _export_record(record) -> Dict[str, Any]:
+        """Dataclass as a dict with its epoch timestamp rendered as ISO 8601"""
+        data = asdict(record)
+        data['timestamp'] = datetime.fromtimestamp(record.timestamp).isoformat()
+        return data
+    
     def save_metrics(self) -> None:
-        """Save metrics data to persistent storage"""
+        """Flush the query log and snapshot the counters to persistent storage"""
         try:
-            data = {
-                'total_queries': self.total_queries,
-                'successful_queries': self.successful_queries,
-                'failed_queries': self.failed_queries,
-                'total_tokens_used': self.total_tokens_used,
-                'model_usage': dict(self.model_usage),
-                'query_history': list(self.query_history),
-                'system_history': list(self.system_history),
-                'last_save': datetime.now().isoformat()
-            }
+            self._dirty.clear()
+            self._last_snapshot = time.monotonic()
             
-            with open(METRICS_STORAGE_FILE, 'wb') as f:
-                pickle.dump(data, f)
+            with self.lock:
+                self._drain_ingest_queue()
+                self._query_log.flush()
+                if os.fstat(self._query_log.fileno()).st_size > METRICS_LOG_MAX_BYTES:
+                    self._compact_query_log()
+                
+                data = {
+                    'total_queries': self.total_queries,
+                    'successful_queries': self.successful_queries,
+                    'failed_queries': self.failed_queries,
+                    'total_tokens_used': self.total_tokens_used,
+                    'model_usage': dict(self.model_usage),
+                    'last_save': time.time()
+                }
+            
+            # Write-then-rename so a reader never sees a half-written snapshot
+            tmp_path = METRICS_COUNTERS_FILE + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(_json_bytes(data))
+            os.replace(tmp_path, METRICS_COUNTERS_FILE)
                 
         except Exception as e:
             logger.error(f"Error saving metrics: {e}")
     
+    def _save_if_dirty(self) -> None:
+        """Save only if queries were recorded since the last snapshot
+        
+        A process that recorded nothing must not write its (possibly stale)
+        counters over a snapshot saved by another process in the meantime.
+        """
+        if self._dirty.is_set():
+            self.save_metrics()
+    
+    def _compact_query_log(self) -> None:
+        """Rewrite the query log to just the in-memory history (caller holds the lock)"""
+        tmp_path = METRICS_LOG_FILE + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            for q in list(self.query_history):
+                f.write(_json_bytes(q) + b'\n')
+        # Windows can't replace a file that is open, so release our own handle first
+        self._query_log.close()
+        try:
+            os.replace(tmp_path, METRICS_LOG_FILE)
+        except OSError as e:
+            # e.g. another process has the log open on Windows; keep appending to it
+            logger.warning(f"Could not compact metrics log: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        finally:
+            self._query_log = open(METRICS_LOG_FILE, 'ab', buffering=64 * 1024)
+    
     def load_metrics(self) -> None:
         """Load metrics data from persistent storage"""
         try:
-            if os.path.exists(METRICS_STORAGE_FILE):
-                with open(METRICS_STORAGE_FILE, 'rb') as f:
-                    data = pickle.load(f)
+            last_save = 0.0
+            if os.path.exists(METRICS_COUNTERS_FILE):
+                with open(METRICS_COUNTERS_FILE, 'rb') as f:
+                    data = _json_loads(f.read())
                 
                 self.total_queries = data.get('total_queries', 0)
                 self.successful_queries = data.get('successful_queries', 0)
                 self.failed_queries = data.get('failed_queries', 0)
                 self.total_tokens_used = data.get('total_tokens_used', 0)
                 self.model_usage = defaultdict(int, data.get('model_usage', {}))
+                last_save = data.get('last_save', 0.0)
+            elif os.path.exists(LEGACY_METRICS_FILE):
+                self._migrate_legacy_counters()
+            
+            if os.path.exists(METRICS_LOG_FILE):
+                # Only the newest entries can make it into the history
+                with open(METRICS_LOG_FILE, 'rb') as f:
+                    lines = deque(f, maxlen=10000)
                 
-                # Load history with proper maxlen
-                query_history = data.get('query_history', [])
-                self.query_history = deque(query_history, maxlen=10000)
-                
-                system_history = data.get('system_history', [])
-                self.system_history = deque(system_history, maxlen=1440)
+                for line in lines:
+                    try:
+                        query_metrics = QueryMetrics(**_json_loads(line))
+                        query_metrics.model_name = sys.intern(query_metrics.model_name)
+                        query_metrics.query_type = sys.intern(query_metrics.query_type)
+                    except (ValueError, TypeError):
+                        continue  # Torn line from an interrupted write
+                    if query_metrics.timestamp > last_save:
+                        # Recorded after the last snapshot: not in the counters yet
+                        self._apply_query(query_metrics)
+                    else:
+                        self._add_to_history(query_metrics)
                 
         except Exception as e:
             logger.error(f"Error loading metrics: {e}")
 
+    def _migrate_legacy_counters(self) -> None:
+        """Carry the lifetime counters over from the pickle earlier versions saved
+        
+        Only the counters move; the pickled history predates the query log and its
+        records use the old datetime timestamps. The pickle is left in place, and
+        isn't read again once the first counters snapshot exists.
+        """
+        try:
+            with open(LEGACY_METRICS_FILE, 'rb') as f:
+                data = _LegacyUnpickler(f).load()
+        except Exception as e:
+            logger.warning(f"Could not read legacy metrics file: {e}")
+            return
+        
+        self.total_queries = data.get('total_queries', 0)
+        self.successful_queries = data.get('successful_queries', 0)
+        self.failed_queries = data.get('failed_queries', 0)
+        self.total_tokens_used = data.get('total_tokens_used', 0)
+        self.model_usage = defaultdict(int, data.get('model_usage', {}))
+        self._dirty.set()
+        logger.info(f"Migrated counters for {self.total_queries} queries from {LEGACY_METRICS_FILE}")
+
 # Global metrics collector instance (lazy-loaded)
 _metrics_collector_instance = None
 
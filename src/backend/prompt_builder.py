@@ -1,39 +1,74 @@
 from typing import List, Dict, Optional, Any
 from document_processor import DocumentChunk
+from collections import deque
+import itertools
 import logging
 import re
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Query type keywords, checked in priority order. Keywords match anywhere in the
+# query (so "analyzed" counts as analysis), as the original substring test did.
+QUERY_TYPE_PATTERNS = (
+    ("analysis", re.compile("analyze|analysis|examine|investigate|study|review", re.IGNORECASE)),
+    ("summary", re.compile("summarize|summary|summarise|overview|brief|outline", re.IGNORECASE)),
+    ("qa", re.compile("what|how|why|when|where|who|explain|describe|tell me", re.IGNORECASE)),
+)
+
+# {variable} placeholder; splitting on it alternates literal text and variable names
+PLACEHOLDER_PATTERN = re.compile(r"\{([^{}]+)\}")
+
+# Metadata shown next to each context chunk, in display order
+CONTEXT_METADATA_LABELS = (
+    ("page_number", "Page {}"),
+    ("section", "Section: {}"),
+    ("file_name", "File: {}"),
+)
+
+def _fmt_meta(metadata: Optional[Dict[str, Any]]) -> str:
+    """Bracketed source note for a context chunk, or "" if it has no displayable metadata"""
+    if not metadata:
+        return ""
+    parts = [label.format(metadata[key]) for key, label in CONTEXT_METADATA_LABELS if metadata.get(key)]
+    return f" [{', '.join(parts)}]" if parts else ""
+
+def _preview(content: str, limit: int = 200) -> str:
+    """First limit characters of content, with an ellipsis if anything was cut"""
+    return content[:limit] + "..." if len(content) > limit else content
+
 class PromptTemplate:
     """Base class for prompt templates"""
     
     def __init__(self, template: str, variables: Dict[str, Any] = None):
         self.template = template
         self.variables = variables or {}
+        # Parsed once: even indices are literal text, odd indices are variable names
+        self._parts = PLACEHOLDER_PATTERN.split(template)
     
     def format(self, **kwargs) -> str:
         """Format the template with provided variables"""
         # Merge template variables with provided kwargs
         all_vars = {**self.variables, **kwargs}
         
-        # Simple template formatting with {variable} syntax
-        formatted = self.template
-        for key, value in all_vars.items():
-            placeholder = f"{{{key}}}"
-            if placeholder in formatted:
-                formatted = formatted.replace(placeholder, str(value))
+        # Simple template formatting with {variable} syntax; unknown placeholders are left as-is
+        parts = self._parts[:]
+        for i in range(1, len(parts), 2):
+            name = parts[i]
+            parts[i] = str(all_vars[name]) if name in all_vars else f"{{{name}}}"
         
-        return formatted
+        return "".join(parts)
 
 class PromptBuilder:
     """Enhanced prompt builder with dynamic templates and context injection"""
     
     def __init__(self):
         self.templates = self._initialize_templates()
-        self.conversation_history = []
         self.max_history_length = 5
+        # Oldest turns drop off automatically once max_history_length is reached
+        self.conversation_history = deque(maxlen=self.max_history_length)
+        # Formatted history, rebuilt only after the history changes
+        self._history_cache: Optional[str] = None
     
     def _initialize_templates(self) -> Dict[str, PromptTemplate]:
         """Initialize default prompt templates"""
@@ -122,73 +157,42 @@ ANSWER:"""
             "timestamp": datetime.now().isoformat()
         })
         
-        # Keep only recent history
-        if len(self.conversation_history) > self.max_history_length:
-            self.conversation_history = self.conversation_history[-self.max_history_length:]
+        self._history_cache = None
     
     def format_conversation_history(self) -> str:
         """Format conversation history for prompt inclusion"""
+        if self._history_cache is not None:
+            return self._history_cache
+        
         if not self.conversation_history:
             return "No previous conversation."
         
         history_text = []
-        for i, turn in enumerate(self.conversation_history[-3:], 1):  # Last 3 turns
+        recent = itertools.islice(self.conversation_history, max(0, len(self.conversation_history) - 3), None)
+        for i, turn in enumerate(recent, 1):  # Last 3 turns
             history_text.append(f"Turn {i}:")
             history_text.append(f"User: {turn['user']}")
             history_text.append(f"AI: {turn['ai']}")
             history_text.append("")
         
-        return "\n".join(history_text)
+        self._history_cache = "\n".join(history_text)
+        return self._history_cache
     
     def format_context(self, chunks: List[DocumentChunk], include_metadata: bool = True) -> str:
         """Format document chunks into structured context"""
         if not chunks:
             return "No relevant document content found."
         
-        context_parts = []
-        
-        for i, chunk in enumerate(chunks, 1):
-            # Format chunk content
-            content = chunk.content.strip()
-            
-            # Add metadata if requested
-            metadata_info = ""
-            if include_metadata and chunk.metadata:
-                metadata_parts = []
-                if chunk.metadata.get("page_number"):
-                    metadata_parts.append(f"Page {chunk.metadata['page_number']}")
-                if chunk.metadata.get("section"):
-                    metadata_parts.append(f"Section: {chunk.metadata['section']}")
-                if chunk.metadata.get("file_name"):
-                    metadata_parts.append(f"File: {chunk.metadata['file_name']}")
-                
-                if metadata_parts:
-                    metadata_info = f" [{', '.join(metadata_parts)}]"
-            
-            # Create formatted chunk
-            chunk_text = f"Section {i}{metadata_info}:\n{content}\n"
-            context_parts.append(chunk_text)
-        
-        return "\n".join(context_parts)
+        return "\n".join(
+            f"Section {i}{_fmt_meta(chunk.metadata) if include_metadata else ''}:\n{chunk.content.strip()}\n"
+            for i, chunk in enumerate(chunks, 1)
+        )
     
     def detect_query_type(self, query: str) -> str:
         """Detect the type of query to select appropriate template"""
-        query_lower = query.lower()
-        
-        # Analysis keywords
-        analysis_keywords = ["analyze", "analysis", "examine", "investigate", "study", "review"]
-        if any(keyword in query_lower for keyword in analysis_keywords):
-            return "analysis"
-        
-        # Summary keywords
-        summary_keywords = ["summarize", "summary", "summarise", "overview", "brief", "outline"]
-        if any(keyword in query_lower for keyword in summary_keywords):
-            return "summary"
-        
-        # Q&A keywords (default)
-        qa_keywords = ["what", "how", "why", "when", "where", "who", "explain", "describe", "tell me"]
-        if any(keyword in query_lower for keyword in qa_keywords):
-            return "qa"
+        for query_type, pattern in QUERY_TYPE_PATTERNS:
+            if pattern.search(query):
+                return query_type
         
         return "default_rag"
     
@@ -248,18 +252,17 @@ ANSWER:"""
             "query": query,
             "detected_template": self.detect_query_type(query),
             "chunk_count": len(chunks),
-            "chunks_with_metadata": []
+            "chunks_with_metadata": [
+                {
+                    "index": i,
+                    "content_preview": _preview(chunk.content),
+                    "metadata": chunk.metadata,
+                    "length": len(chunk.content)
+                }
+                for i, chunk in enumerate(chunks, 1)
+            ]
         }
         
-        for i, chunk in enumerate(chunks):
-            chunk_info = {
-                "index": i + 1,
-                "content_preview": chunk.content[:200] + "..." if len(chunk.content) > 200 else chunk.content,
-                "metadata": chunk.metadata,
-                "length": len(chunk.content)
-            }
-            debug_info["chunks_with_metadata"].append(chunk_info)
-        
         return debug_info
     
     def add_custom_template(self, name: str, template: str, variables: Dict[str, Any] = None):
@@ -273,5 +276,6 @@ ANSWER:"""
     
     def clear_conversation_history(self):
         """Clear conversation history"""
-        self.conversation_history = []
+        self.conversation_history.clear()
+        self._history_cache = None
         logger.info("Conversation history cleared") 
\ No newline at end of file
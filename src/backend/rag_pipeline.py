@@ -1,7 +1,7 @@
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Iterable
 from document_processor import DocumentChunk
-from vector_store import VectorStore
 from prompt_builder import PromptBuilder
+import itertools
 import logging
 import os
 
@@ -16,32 +16,76 @@ class RAGPipeline:
         Args:
             vector_store_path: Path to save/load vector store
         """
-        self.vector_store = VectorStore()
+        # Created on first use; importing it pulls in sentence-transformers/torch and faiss
+        self._vector_store = None
         self.vector_store_path = vector_store_path or "vector_store"
         self.prompt_builder = PromptBuilder()
         
-        # Try to load existing vector store
-        if os.path.exists(self.vector_store_path + ".faiss"):
-            try:
-                self.vector_store.load_index(self.vector_store_path)
-                logger.info("Loaded existing vector store")
-            except Exception as e:
-                logger.warning(f"Could not load existing vector store: {e}")
+        # Set when chunks were added without writing the index to disk
+        self._unsaved = False
+    
+    @property
+    def vector_store(self):
+        """The pipeline's VectorStore, loaded from vector_store_path on first access"""
+        if self._vector_store is None:
+            from vector_store import VectorStore
+            self._vector_store = VectorStore()
+            
+            # Try to load existing vector store
+            if os.path.exists(self.vector_store_path + ".faiss"):
+                try:
+                    self._vector_store.load_index(self.vector_store_path)
+                    logger.info("Loaded existing vector store")
+                except Exception as e:
+                    logger.warning(f"Could not load existing vector store: {e}")
+        return self._vector_store
     
     def add_document(self, chunks: List[DocumentChunk]):
         """Add document chunks to the vector store"""
+        self.add_documents(chunks, defer_save=False)
+    
+    def add_documents(self, chunks: Iterable[DocumentChunk], defer_save: bool = True):
+        """
+        Add chunks from any number of documents, embedding them in batches
+        
+        Chunks are pulled from the iterable in embedding-sized batches, so a
+        generator such as EnhancedPDFProcessor.iter_chunks is never held in memory
+        all at once. With defer_save the index is only written by flush(), so
+        loading many documents costs a single write.
+        
+        Args:
+            chunks: Chunks to add, e.g. itertools.chain.from_iterable(per_page_chunks)
+            defer_save: Leave the index unsaved until flush() is called
+        """
+        vector_store = self.vector_store
+        from vector_store import EMBEDDING_BATCH_SIZE
+        
+        chunks = iter(chunks)
+        added = 0
         try:
-            self.vector_store.add_documents(chunks)
+            while True:
+                batch = list(itertools.islice(chunks, EMBEDDING_BATCH_SIZE))
+                if not batch:
+                    break
+                vector_store.add_documents(batch)
+                self._unsaved = True
+                added += len(batch)
             
             # Save the updated vector store
-            if self.vector_store_path:
-                self.vector_store.save_index(self.vector_store_path)
+            if not defer_save:
+                self.flush()
                 
-            logger.info(f"Added {len(chunks)} chunks to RAG pipeline")
+            logger.info(f"Added {added} chunks to RAG pipeline")
         except Exception as e:
             logger.error(f"Error adding documents to vector store: {e}")
             raise
     
+    def flush(self):
+        """Write the vector store to disk if chunks were added since the last save"""
+        if self._unsaved and self.vector_store_path:
+            self.vector_store.save_index(self.vector_store_path)
+        self._unsaved = False
+    
     def find_relevant_chunks(self, query: str, top_k: int = 3) -> List[DocumentChunk]:
         """
         Find relevant chunks using semantic search
@@ -116,7 +160,9 @@ Provide a comprehensive answer using the document information provided."""
     
     def clear_pipeline(self):
         """Clear all data from the pipeline"""
-        self.vector_store.clear()
+        # Nothing is in memory if the store was never used; the files below still go
+        if self._vector_store is not None:
+            self._vector_store.clear()
         
         # Remove saved files
         if self.vector_store_path:
@@ -132,12 +178,17 @@ Provide a comprehensive answer using the document information provided."""
         """Save the pipeline state"""
         path = filepath or self.vector_store_path
         self.vector_store.save_index(path)
+        if path == self.vector_store_path:
+            self._unsaved = False
         logger.info(f"RAG pipeline saved to {path}")
     
     def load_pipeline(self, filepath: str = None):
         """Load the pipeline state"""
         path = filepath or self.vector_store_path
-        self.vector_store.load_index(path)
+        if self._vector_store is None:
+            from vector_store import VectorStore
+            self._vector_store = VectorStore()
+        self._vector_store.load_index(path)
         logger.info(f"RAG pipeline loaded from {path}")
     
     def add_conversation_turn(self, user_query: str, ai_response: str):
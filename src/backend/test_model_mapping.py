@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Test script for mapping Ollama model tags to Hugging Face checkpoints
+"""
+
+import sys
+import os
+
+# Add the current directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fine_tuning import FineTuningManager
+
+# Ollama tag -> expected Hugging Face model id
+EXPECTED_MAPPINGS = {
+    "llama3": "meta-llama/Llama-3.2-3B-Instruct",
+    "llama3:8b": "meta-llama/Llama-3.2-8B-Instruct",
+    "llama3-70b": "meta-llama/Llama-3.2-70B-Instruct",
+    "llama3.2:3b": "meta-llama/Llama-3.2-3B-Instruct",
+    "llama2": "meta-llama/Llama-2-7b-chat-hf",
+    "llama2:13b": "meta-llama/Llama-2-13b-chat-hf",
+    "llama2-13b": "meta-llama/Llama-2-13b-chat-hf",
+    "llama2_70b": "meta-llama/Llama-2-70b-chat-hf",
+    "phi3:mini": "microsoft/Phi-3-mini-4k-instruct",
+    "phi3:medium": "microsoft/Phi-3-medium-4k-instruct",
+    "phi3": "microsoft/Phi-3-mini-4k-instruct",
+    "mistral:7b": "mistralai/Mistral-7B-Instruct-v0.2",
+    "codellama:13b": "codellama/CodeLlama-13b-Instruct-hf",
+    "codellama:34b-instruct": "codellama/CodeLlama-34b-Instruct-hf",
+    "gemma:7b": "google/gemma-7b-it",
+    "gemma": "google/gemma-2b-it",
+    "qwen:14b": "Qwen/Qwen2-14B-Instruct",
+    "qwen2-72b": "Qwen/Qwen2-72B-Instruct",
+}
+
+def test_model_mapping():
+    """Check every Ollama tag resolves to its expected Hugging Face model"""
+    print("Testing Ollama -> Hugging Face model mapping...")
+    
+    failures = []
+    for ollama_model, expected in EXPECTED_MAPPINGS.items():
+        actual = FineTuningManager._detect_model_family(ollama_model.lower())
+        status = "ok" if actual == expected else "FAIL"
+        print(f"  {status:4} {ollama_model:24} -> {actual}")
+        if actual != expected:
+            failures.append((ollama_model, expected, actual))
+    
+    assert not failures, f"Unexpected mappings: {failures}"
+
+if __name__ == "__main__":
+    try:
+        test_model_mapping()
+        print("\n✅ All model mappings resolved as expected")
+    except AssertionError as e:
+        print(f"\n❌ {e}")
+        sys.exit(1)
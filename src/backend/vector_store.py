@@ -10,6 +10,9 @@ from document_processor import DocumentChunk
 # Set up logging
 logger = logging.getLogger(__name__)
 
+# Texts per encoder forward pass when embedding many chunks at once
+EMBEDDING_BATCH_SIZE = 64
+
 class VectorStore:
     def __init__(self, model_name: str = "all-MiniLM-L6-v2", dimension: int = 384):
         """
@@ -46,7 +49,7 @@ class VectorStore:
             if self.model is None:
                 self._load_model()
             
-            embeddings = self.model.encode(texts, show_progress_bar=False)
+            embeddings = self.model.encode(texts, batch_size=EMBEDDING_BATCH_SIZE, show_progress_bar=False)
             logger.info(f"Generated embeddings for {len(texts)} texts")
             return embeddings
         except Exception as e:
@@ -863,7 +863,8 @@ result = fine_tuning_manager.start_fine_tuning(
     learning_rate=args['learningRate'],
     epochs=args['epochs'],
     batch_size=args['batchSize'],
-    files=args['files']
+    files=args['files'],
+    eval_ratio=args.get('evalRatio', 0)
 )
 print(json.dumps(result))
       `]);